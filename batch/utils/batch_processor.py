@@ -2,6 +2,7 @@ import os
 import gc
 from batch.utils.settings_check import check_settings
 from batch.utils.video_processor import process_video
+from core.utils.ask_gpt import write_llm_report
 from core.utils.config_utils import load_key, update_key
 import pandas as pd
 from rich.console import Console
@@ -90,6 +91,8 @@ def process_batch():
         else:
             print(f"Skipping task: {row['Video File']} - Status: {row['Status']}")
 
+    # endpoints, rate limits and stores are shared by all videos, they are reported once per batch
+    write_llm_report(os.path.join('batch', 'output', 'llm_report.json'))
     console.print(Panel("All tasks processed!\nCheck out in `batch/output`!", 
                        title="[bold green]Batch Processing Complete", expand=False))
 
@@ -7,6 +7,10 @@ from functools import partial
 from rich.panel import Panel
 from rich.console import Console
 from core import *
+from core.utils.retry_policy import RETRY, is_fail_fast
+from core.utils.models_batch import PathManager, _GPT_LOG_FOLDER, _LLM_REPORT
+from core.utils.ask_gpt import write_llm_report
+from core.utils.llm_stats import STATS, video_of
 
 console = Console()
 
@@ -19,6 +23,9 @@ YTB_RESOLUTION_KEY = "ytb_resolution"
 def process_video(file, dubbing=False, is_retry=False):
     if not is_retry:
         prepare_output_folder(OUTPUT_DIR)
+    # every batch video runs in `output`, so the budget and the counters of the previous one are dropped
+    RETRY.reset_video(_GPT_LOG_FOLDER(PathManager()))
+    STATS.reset_video(video_of(_GPT_LOG_FOLDER(PathManager())))
     
     text_steps = [
         ("🎥 Processing input file", partial(process_input_file, file)),
@@ -54,12 +61,14 @@ def process_video(file, dubbing=False, is_retry=False):
                     globals().update(result)
                 break
             except Exception as e:
-                if attempt == 2:
+                # a dead endpoint or an exhausted retry budget will not recover by re-running the step
+                if attempt == 2 or is_fail_fast(e):
                     error_panel = Panel(
                         f"[bold red]Error in step '{current_step}':[/]\n{str(e)}",
                         border_style="red"
                     )
                     console.print(error_panel)
+                    write_llm_report(_LLM_REPORT(PathManager()), _GPT_LOG_FOLDER(PathManager()))
                     cleanup(ERROR_OUTPUT_DIR)
                     return False, current_step, str(e)
                 console.print(Panel(
@@ -68,6 +77,7 @@ def process_video(file, dubbing=False, is_retry=False):
                 ))
     
     console.print(Panel("[bold green]All steps completed successfully! 🎉[/]", border_style="green"))
+    write_llm_report(_LLM_REPORT(PathManager()), _GPT_LOG_FOLDER(PathManager()))
     cleanup(SAVE_DIR)
     return True, "", ""
 
@@ -17,11 +17,12 @@ def split_by_spacy(video_file):
     SPLIT_BY_MARK_FILE = _SPLIT_BY_MARK_FILE(pathManager)
     CLEANED_CHUNKS = _2_CLEANED_CHUNKS(pathManager)
     SPLIT_BY_NLP = _3_1_SPLIT_BY_NLP(pathManager)
-    nlp = init_nlp(console)
-    split_by_mark(nlp,CLEANED_CHUNKS, SPLIT_BY_MARK_FILE,console)
-    split_by_comma_main(nlp,SPLIT_BY_COMMA_FILE, SPLIT_BY_MARK_FILE,console)
-    split_sentences_main(nlp,SPLIT_BY_COMMA_FILE, SPLIT_BY_CONNECTOR_FILE,console)
-    split_long_by_root_main(nlp,SPLIT_BY_CONNECTOR_FILE,SPLIT_BY_NLP,console)
+    nlp = init_nlp(console, needs=PARSE_PIPES)
+    debug_files = {"mark": SPLIT_BY_MARK_FILE, "comma": SPLIT_BY_COMMA_FILE, "connector": SPLIT_BY_CONNECTOR_FILE}
+    try:
+        split_by_nlp_pipeline(nlp, CLEANED_CHUNKS, SPLIT_BY_NLP, console, debug_files=debug_files)
+    finally:
+        release_nlp(nlp)
     return
 
 if __name__ == '__main__':
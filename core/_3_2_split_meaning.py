@@ -1,8 +1,10 @@
 import concurrent.futures
-from difflib import SequenceMatcher
 import math
 from core.prompts import get_split_prompt
-from core.spacy_utils.load_nlp_model import init_nlp
+from core.spacy_utils.load_nlp_model import init_nlp, release_nlp, PARSE_PIPES, TOKENIZER_ONLY
+from core.spacy_utils.heuristic_split import propose_split
+from core.utils.llm_stats import STATS
+from core.split_align import align_split_positions
 from core.utils import *
 from rich.console import Console
 from rich.table import Table
@@ -10,9 +12,25 @@ from core.utils.models_batch import *
 import threading
 
 
-def tokenize_sentence(sentence, nlp):
-    doc = nlp(sentence)
-    return [token.text for token in doc]
+def count_tokens(sentences, nlp, batch_size=64):
+    """Token count of each sentence, tokenized in batches (tokenizer only, no parse)"""
+    return [len(doc) for doc in nlp.tokenizer.pipe(sentences, batch_size=batch_size)]
+
+
+def heuristic_splits(sentences, max_length, nlp, GPT_LOG_FOLDER):
+    """Split the easy sentences locally, return {index: parts} for the ones confident enough"""
+    min_confidence = load_key("split_heuristic.min_confidence", 0.8)
+    min_part_length = load_key("split_heuristic.min_part_length", 3)
+    splits = {}
+    indexes = list(sentences)
+    for index, doc in zip(indexes, nlp.pipe([sentences[i] for i in indexes], batch_size=32)):
+        parts, confidence = propose_split(doc, max_length, min_part_length)
+        if parts and confidence >= min_confidence:
+            splits[index] = parts
+            get_console().print(f"[green]✅ Sentence {index} split locally (confidence {confidence:.2f}): {' || '.join(parts)}[/green]")
+    if splits:
+        STATS.record(GPT_LOG_FOLDER, "split_by_meaning", calls_avoided=len(splits))
+    return splits
 
 
 # 为每个线程创建一个 Console 实例
@@ -26,35 +44,9 @@ def get_console():
 
 def find_split_positions(original, modified):
     console = get_console()  # 获取线程本地的 console
-    split_positions = []
-    parts = modified.split('[br]')
-    start = 0
-    whisper_language = load_key("whisper.language")
-    language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language
-    joiner = get_joiner(language)
-
-    for i in range(len(parts) - 1):
-        max_similarity = 0
-        best_split = None
-
-        for j in range(start, len(original)):
-            original_left = original[start:j]
-            modified_left = joiner.join(parts[i].split())
-
-            left_similarity = SequenceMatcher(None, original_left, modified_left).ratio()
-
-            if left_similarity > max_similarity:
-                max_similarity = left_similarity
-                best_split = j
-
-        if max_similarity < 0.9:
-            console.print(f"[yellow]Warning: low similarity found at the best split point: {max_similarity}[/yellow]")
-        if best_split is not None:
-            split_positions.append(best_split)
-            start = best_split
-        else:
-            console.print(f"[yellow]Warning: Unable to find a suitable split point for the {i + 1}th part.[/yellow]")
-
+    split_positions, similarity = align_split_positions(original, modified)
+    if similarity < 0.9:
+        console.print(f"[yellow]Warning: low similarity found at the best split point: {similarity}[/yellow]")
     return split_positions
 
 
@@ -99,33 +91,45 @@ def split_sentence(sentence, num_parts, GPT_LOG_FOLDER, word_limit=20, index=-1,
     return best_split
 
 
-def parallel_split_sentences(sentences, max_length, max_workers, nlp, GPT_LOG_FOLDER,retry_attempt=0, ):
-    """Split sentences in parallel using a thread pool."""
-    new_sentences = [None] * len(sentences)
+def parallel_split_sentences(sentences, max_length, max_workers, nlp, GPT_LOG_FOLDER,retry_attempt=0, pending=None):
+    """Split sentences in parallel using a thread pool.
+
+    Only the sentences at the indexes in `pending` (all of them if None) are tokenized and checked.
+    Returns the new sentence list and the indexes of the parts produced by a split, which are the
+    only ones that can still be too long in the next pass."""
+    if pending is None:
+        pending = range(len(sentences))
+    pending = list(pending)
+    token_counts = dict(zip(pending, count_tokens([sentences[i] for i in pending], nlp)))
+    new_sentences = [[sentence] for sentence in sentences]
     futures = []
 
+    too_long = {index: sentences[index] for index in pending if token_counts[index] > max_length}
+    local = heuristic_splits(too_long, max_length, nlp, GPT_LOG_FOLDER) if load_key("split_heuristic.enabled", True) else {}
+    for index, parts in local.items():
+        new_sentences[index] = parts
+
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for index, sentence in enumerate(sentences):
-            # Use tokenizer to split the sentence
-            tokens = tokenize_sentence(sentence, nlp)
-            # print("Tokenization result:", tokens)
-            num_parts = math.ceil(len(tokens) / max_length)
-            if len(tokens) > max_length:
-                future = executor.submit(split_sentence, sentence, num_parts,GPT_LOG_FOLDER, max_length, index=index,
+        for index in too_long:
+            if index not in local:
+                num_parts = math.ceil(token_counts[index] / max_length)
+                future = executor.submit(split_sentence, sentences[index], num_parts,GPT_LOG_FOLDER, max_length, index=index,
                                         retry_attempt=retry_attempt)
-                futures.append((future, index, num_parts, sentence))
-            else:
-                new_sentences[index] = [sentence]
+                futures.append((future, index))
 
-        for future, index, num_parts, sentence in futures:
+        for future, index in futures:
             split_result = future.result()
             if split_result:
                 split_lines = split_result.strip().split('\n')
                 new_sentences[index] = [line.strip() for line in split_lines]
-            else:
-                new_sentences[index] = [sentence]
 
-    return [sentence for sublist in new_sentences for sentence in sublist]
+    split_indexes = {index for _, index in futures} | set(local)
+    result, next_pending = [], []
+    for index, parts in enumerate(new_sentences):
+        if index in split_indexes:
+            next_pending.extend(range(len(result), len(result) + len(parts)))
+        result.extend(parts)
+    return result, next_pending
 
 
 # @check_file_exists(_3_2_SPLIT_BY_MEANING)
@@ -140,17 +144,29 @@ def split_sentences_by_meaning(video_name):
     with open(SPLIT_BY_NLP, 'r', encoding='utf-8') as f:
         sentences = [line.strip() for line in f.readlines()]
 
-    nlp = init_nlp(console)
-    # 🔄 process sentences multiple times to ensure all are split
-    for retry_attempt in range(3):
-        sentences = parallel_split_sentences(sentences, max_length=load_key("max_split_length"),
-                                             max_workers=load_key("max_workers"), nlp=nlp,GPT_LOG_FOLDER=GPT_LOG_FOLDER, retry_attempt=retry_attempt
-                                             )
+    # the local pre-splitter needs the parse, otherwise only token counts are needed
+    nlp = init_nlp(console, needs=PARSE_PIPES if load_key("split_heuristic.enabled", True) else TOKENIZER_ONLY)
+    # 🔄 process sentences multiple times to ensure all are split, only re-checking the parts of split sentences
+    pending = None
+    stats_before = STATS.counters(GPT_LOG_FOLDER, "split_by_meaning")
+    try:
+        for retry_attempt in range(3):
+            sentences, pending = parallel_split_sentences(sentences, max_length=load_key("max_split_length"),
+                                                          max_workers=load_key("max_workers"), nlp=nlp,GPT_LOG_FOLDER=GPT_LOG_FOLDER,
+                                                          retry_attempt=retry_attempt, pending=pending)
+            if not pending:
+                break
+    finally:
+        release_nlp(nlp)
 
     # 💾 save results
     with open(SPLIT_BY_MEANING, 'w', encoding='utf-8') as f:
         f.write('\n'.join(sentences))
     console.print('[green]✅ All sentences have been successfully split![/green]')
+    stats_after = STATS.counters(GPT_LOG_FOLDER, "split_by_meaning")
+    run = {name: stats_after[name] - stats_before.get(name, 0) for name in ("calls", "cache_hits", "calls_avoided")}
+    console.print(f"[green]📊 Long sentences split locally: {run['calls_avoided']}, "
+                  f"from the cache: {run['cache_hits']}, sent to the LLM: {run['calls'] - run['cache_hits']}[/green]")
 
 
 if __name__ == '__main__':
@@ -1,9 +1,12 @@
 import json
 import threading
-from core.prompts import get_summary_prompt
+import concurrent.futures
+from core.prompts import get_summary_prompt, get_summary_reduce_prompt
 import pandas as pd
 from core.utils import *
 from core.utils.models_batch import *
+from core.utils.term_index import get_term_index
+from core.utils.llm_stats import STATS
 from rich.console import Console
 
 # 为每个线程创建一个 Console 实例
@@ -23,21 +26,58 @@ def combine_chunks(SPLIT_BY_MEANING):
     combined_text = ' '.join(cleaned_sentences)
     return combined_text[:load_key('summary_length')]  #! Return only the first x characters
 
+# ------------
+# map-reduce over long transcripts
+# ------------
+# The transcript is cut into shards of at most `summary_length` characters on sentence
+# boundaries. A transcript that fits in one shard keeps the single call (same prompt as
+# before, so cached responses still hit). Longer ones are summarized shard by shard on the
+# shared llm pool, and the terms are merged locally. The reduce call only runs when the merge
+# leaves something for the llm to decide: conflicting translations of a term, too many terms
+# or too many partial themes.
+
+def shard_transcript(SPLIT_BY_MEANING, shard_length, max_shards):
+    """Cut the transcript into at most `max_shards` texts of about `shard_length` characters"""
+    with open(SPLIT_BY_MEANING, 'r', encoding='utf-8') as file:
+        sentences = [line.strip() for line in file if line.strip()]
+    total = sum(len(sentence) + 1 for sentence in sentences)
+    # with a capped number of shards, the shards grow instead of dropping the end of the video
+    shard_length = max(shard_length, -(-total // max(max_shards, 1)))
+    # a shard ends where the running length passes the next multiple of `shard_length`,
+    # so short shards do not add up to more than `max_shards`
+    shards, current, consumed = [], [], 0
+    for sentence in sentences:
+        if current and consumed + len(sentence) + 1 > (len(shards) + 1) * shard_length:
+            shards.append(' '.join(current))
+            current = []
+        current.append(sentence)
+        consumed += len(sentence) + 1
+    if current:
+        shards.append(' '.join(current))
+    return shards
+
+def _term_key(src):
+    return ' '.join(str(src).lower().split())
+
+def merge_terms(partials):
+    """Deduplicate the terms of the shard summaries, returns (terms, conflicts)"""
+    merged, translations = {}, {}
+    for partial in partials:
+        for term in partial['terms']:
+            key = _term_key(term['src'])
+            if not key:
+                continue
+            merged.setdefault(key, term)
+            tgt = str(term['tgt']).strip()
+            if tgt not in translations.setdefault(key, []):
+                translations[key].append(tgt)
+    terms = list(merged.values())
+    conflicts = {merged[key]['src']: tgts for key, tgts in translations.items() if len(tgts) > 1}
+    return terms, conflicts
+
 def search_things_to_note_in_prompt(sentence,TERMINOLOGY):
     """Search for terms to note in the given sentence"""
-    with open(TERMINOLOGY, 'r', encoding='utf-8') as file:
-        things_to_note = json.load(file)
-    things_to_note_list = [term['src'] for term in things_to_note['terms'] if term['src'].lower() in sentence.lower()]
-    if things_to_note_list:
-        prompt = '\n'.join(
-            f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
-            f' meaning: {term["note"]}'
-            for i, term in enumerate(things_to_note['terms'])
-            if term['src'] in things_to_note_list
-        )
-        return prompt
-    else:
-        return None
+    return get_term_index(TERMINOLOGY).prompt(sentence)
 
 def get_summary(video_name):
     console = get_console()
@@ -45,7 +85,6 @@ def get_summary(video_name):
     TERMINOLOGY = _4_1_TERMINOLOGY(pathManager)
     SPLIT_BY_MEANING = _3_2_SPLIT_BY_MEANING(pathManager)
     GPT_LOG_FOLDER = _GPT_LOG_FOLDER(pathManager)
-    src_content = combine_chunks(SPLIT_BY_MEANING)
     custom_terms = pd.read_excel(CUSTOM_TERMS_PATH)
     custom_terms_json = {
         "terms": 
@@ -61,9 +100,8 @@ def get_summary(video_name):
     if len(custom_terms) > 0:
         console.print(f"📖 Custom Terms Loaded: {len(custom_terms)} terms")
         console.print("📝 Terms Content:", json.dumps(custom_terms_json, indent=2, ensure_ascii=False))
-    summary_prompt = get_summary_prompt(src_content, custom_terms_json)
     console.print("📝 Summarizing and extracting terminology ...")
-    
+
     def valid_summary(response_data):
         required_keys = {'src', 'tgt', 'note'}
         if 'terms' not in response_data:
@@ -73,7 +111,27 @@ def get_summary(video_name):
                 return {"status": "error", "message": "Invalid response format"}   
         return {"status": "success", "message": "Summary completed"}
 
-    summary = ask_gpt(summary_prompt, resp_type='json', valid_def=valid_summary, log_title='summary',GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+    shards = shard_transcript(SPLIT_BY_MEANING, load_key('summary_length'), load_key('summary.max_shards', 8))
+    if len(shards) <= 1:
+        summary_prompt = get_summary_prompt(combine_chunks(SPLIT_BY_MEANING), custom_terms_json)
+        summary = ask_gpt(summary_prompt, resp_type='json', valid_def=valid_summary, log_title='summary',GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+    else:
+        console.print(f"📚 Long transcript: summarizing {len(shards)} shards in parallel ...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+            partials = list(executor.map(
+                lambda shard: ask_gpt(get_summary_prompt(shard, custom_terms_json), resp_type='json', valid_def=valid_summary,
+                                      log_title='summary', GPT_LOG_FOLDER=GPT_LOG_FOLDER),
+                shards))
+        themes = [str(partial.get('theme', '')).strip() for partial in partials if str(partial.get('theme', '')).strip()]
+        terms, conflicts = merge_terms(partials)
+        max_terms = load_key('summary.max_terms', 40)
+        if conflicts or len(terms) > max_terms or len(themes) > load_key('summary.max_local_themes', 2):
+            console.print(f"🔀 Reducing {len(terms)} terms ({len(conflicts)} conflicting) and {len(themes)} partial themes ...")
+            summary = ask_gpt(get_summary_reduce_prompt(themes, terms, conflicts, max_terms), resp_type='json', valid_def=valid_summary,
+                              log_title='summary_reduce', GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+        else:
+            summary = {"theme": ' '.join(themes), "terms": terms}
+            STATS.record(GPT_LOG_FOLDER, 'summary_reduce', calls_avoided=1)
     summary['terms'].extend(custom_terms_json['terms'])
     
     with open(TERMINOLOGY, 'w', encoding='utf-8') as f:
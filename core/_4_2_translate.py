@@ -1,16 +1,24 @@
+import os
+import hashlib
 import pandas as pd
 import json
 import concurrent.futures
 import threading
 from core.translate_lines import translate_lines
 from core._4_1_summarize import search_things_to_note_in_prompt
-from core._8_1_audio_task import check_len_then_trim
+from core._8_1_audio_task import trim_subtitles
 from core._6_gen_sub import align_timestamp
 from core.utils import *
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from difflib import SequenceMatcher
 from core.utils.models_batch import *
+from core.utils.rate_limiter import estimate_tokens
+from core.utils.llm_batch import BatchPending, run_batched
+from core.utils.retry_policy import is_fail_fast
+from core.utils.llm_stats import STATS
+from core.utils.term_index import get_term_index
+from core.utils.translation_memory import get_translation_memory
 
 # 为每个线程创建一个 Console 实例
 thread_local = threading.local()
@@ -22,45 +30,240 @@ import sys
 # 获取项目根目录的绝对路径
 # project_root = "/home/bmh/VideoLingo"
 # sys.path.append(project_root)
-# Function to split text into chunks
-def split_chunks_by_chars(chunk_size, max_i,SPLIT_BY_MEANING):
-    """Split text into chunks based on character count, return a list of multi-line text chunks"""
-    with open(SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
-        sentences = file.read().strip().split('\n')
+def get_chunk_token_budget(scale=1.0):
+    """Source tokens per chunk, bounded by the model context window and the target latency per call"""
+    output_factor = load_key("translate.output_factor", 4)  # the json answer repeats origin + direct/free per line
+    by_context = (load_key("translate.context_window", 8192) - load_key("translate.prompt_overhead", 1500)) / (1 + output_factor)
+    by_latency = load_key("translate.target_latency", 60) * load_key("translate.output_tokens_per_second", 40) / output_factor
+    return max(int(min(by_context, by_latency) * scale), load_key("translate.min_chunk_tokens", 50))
 
+def chunk_lines_by_tokens(sentences, max_tokens, max_i):
+    """Group lines into multi-line text chunks based on estimated token count"""
     chunks = []
     chunk = ''
+    chunk_tokens = 0
     sentence_count = 0
     for sentence in sentences:
-        if len(chunk) + len(sentence + '\n') > chunk_size or sentence_count == max_i:
+        sentence_tokens = estimate_tokens(sentence + '\n')
+        if (chunk and chunk_tokens + sentence_tokens > max_tokens) or sentence_count == max_i:
             chunks.append(chunk.strip())
             chunk = sentence + '\n'
+            chunk_tokens = sentence_tokens
             sentence_count = 1
         else:
             chunk += sentence + '\n'
+            chunk_tokens += sentence_tokens
             sentence_count += 1
     chunks.append(chunk.strip())
     return chunks
 
+def read_sentences(SPLIT_BY_MEANING):
+    with open(SPLIT_BY_MEANING, "r", encoding="utf-8") as file:
+        return file.read().strip().split('\n')
+
+def split_chunks_by_tokens(max_tokens, max_i, SPLIT_BY_MEANING):
+    """Split text into chunks based on estimated token count, return a list of multi-line text chunks"""
+    return chunk_lines_by_tokens(read_sentences(SPLIT_BY_MEANING), max_tokens, max_i)
+
+# Shrink chunks for videos whose chunks keep failing validation, grow back slowly after clean runs
+def load_chunk_scale(CHUNK_STATE):
+    if os.path.exists(CHUNK_STATE):
+        with open(CHUNK_STATE, 'r', encoding='utf-8') as f:
+            return json.load(f).get('scale', 1.0)
+    return 1.0
+
+def update_chunk_scale(CHUNK_STATE, scale, failed, total):
+    if failed / max(total, 1) > load_key("translate.shrink_threshold", 0.1):
+        scale = max(scale * 0.7, 0.25)
+    elif not failed:
+        scale = min(scale * 1.1, 1.0)
+    os.makedirs(os.path.dirname(CHUNK_STATE), exist_ok=True)
+    with open(CHUNK_STATE, 'w', encoding='utf-8') as f:
+        json.dump({'scale': scale, 'failed_chunks': failed, 'total_chunks': total}, f, indent=4)
+    return scale
+
 # Get context from surrounding chunks
 def get_previous_content(chunks, chunk_index):
     return None if chunk_index == 0 else chunks[chunk_index - 1].split('\n')[-3:] # Get last 3 lines
 def get_after_content(chunks, chunk_index):
     return None if chunk_index == len(chunks) - 1 else chunks[chunk_index + 1].split('\n')[:2] # Get first 2 lines
 
+# ------------
+# incremental re-translation
+# ------------
+# Every chunk is fingerprinted from all of its inputs (lines, neighbour context, matched terms,
+# theme, mode). A re-run keeps the previous chunk boundaries where the lines are unchanged, so an
+# edit only re-chunks its own region, and only chunks whose fingerprint changed are translated.
+# The rows of unchanged chunks are spliced from the previous translation_results.xlsx. Only this
+# stage is incremental: the later stages still process every row, their llm calls for unchanged
+# rows are answered by the response cache.
+
+def fingerprint_settings():
+    """The config values that change a translation, read once per run"""
+    return [load_key("reflect_translate"), load_key("reflect_gate.enabled", False), load_key("target_language")]
+
+def chunk_fingerprint(chunks, i, theme_prompt, TERMINOLOGY, settings):
+    raw = json.dumps([chunks[i], get_previous_content(chunks, i), get_after_content(chunks, i),
+                      search_things_to_note_in_prompt(chunks[i], TERMINOLOGY), theme_prompt, *settings], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def load_fingerprints(FINGERPRINTS):
+    if os.path.exists(FINGERPRINTS):
+        with open(FINGERPRINTS, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"chunks": []}
+
+def save_fingerprints(FINGERPRINTS, chunks, fingerprints, translations):
+    os.makedirs(os.path.dirname(FINGERPRINTS), exist_ok=True)
+    state = {"chunks": [{"fingerprint": fp, "source": chunk, "translation": translation}
+                        for chunk, fp, translation in zip(chunks, fingerprints, translations)]}
+    with open(FINGERPRINTS, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=4)
+
+def reuse_chunk_boundaries(sentences, previous_chunks, max_tokens, max_i):
+    """Chunk the lines, taking a previous chunk as is wherever its lines still follow each other"""
+    by_first_line = {}
+    for chunk in previous_chunks:
+        lines = chunk.split('\n')
+        by_first_line.setdefault(lines[0], []).append(lines)
+    chunks, pending = [], []
+    k = 0
+    while k < len(sentences):
+        match = next((lines for lines in by_first_line.get(sentences[k], []) if sentences[k:k + len(lines)] == lines), None)
+        if match is None:
+            pending.append(sentences[k])
+            k += 1
+            continue
+        if pending:
+            chunks.extend(chunk_lines_by_tokens(pending, max_tokens, max_i))
+            pending = []
+        chunks.append('\n'.join(match))
+        k += len(match)
+    if pending:
+        chunks.extend(chunk_lines_by_tokens(pending, max_tokens, max_i))
+    return chunks
+
+# 📚 Reuse earlier translations of the same lines (across videos)
+def memory_languages():
+    whisper_language = load_key("whisper.language")
+    src_lang = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
+    return src_lang, load_key("target_language")
+
+def lookup_translation_memory(chunk, TERMINOLOGY):
+    """Return (translation if every line is an exact hit, reference prompt for the partial hits)"""
+    memory = get_translation_memory()
+    if memory is None:
+        return None, None
+    src_lang, tgt_lang = memory_languages()
+    term_index = get_term_index(TERMINOLOGY)
+    hits, references = [], []
+    for line in chunk.split('\n'):
+        hit = memory.get(line, src_lang, tgt_lang, term_index.fingerprint(line))
+        hits.append(hit)
+        if hit is not None:
+            references.append((line, hit))
+        else:
+            references.extend((src, tgt) for _, src, tgt in memory.fuzzy(line, src_lang, tgt_lang))
+    if all(hit is not None for hit in hits):
+        return '\n'.join(hits), None
+    if not references:
+        return None, None
+    return None, ('Translation memory (earlier translations of the same or similar lines, reuse them where they fit):\n' +
+                  '\n'.join(f'- "{src}" -> "{tgt}"' for src, tgt in references))
+
+def save_translation_memory(chunk, translation, TERMINOLOGY):
+    memory = get_translation_memory()
+    if memory is None:
+        return
+    lines, translated = chunk.split('\n'), translation.split('\n')
+    if len(lines) != len(translated):
+        return
+    src_lang, tgt_lang = memory_languages()
+    term_index = get_term_index(TERMINOLOGY)
+    for line, translated_line in zip(lines, translated):
+        memory.put(line, translated_line, src_lang, tgt_lang, term_index.fingerprint(line))
+
 # 🔍 Translate a single chunk
-def translate_chunk(chunk, chunks, theme_prompt, i, TERMINOLOGY, GPT_LOG_FOLDER):
+def translate_chunk(chunk, chunks, theme_prompt, i, TERMINOLOGY, GPT_LOG_FOLDER, failed_chunks=None):
     console = get_console()  # 获取线程本地的 console
+    memory_translation, memory_prompt = lookup_translation_memory(chunk, TERMINOLOGY)
+    if memory_translation is not None:
+        console.print(f"[green]📚 Block {i} reused from the translation memory[/green]")
+        STATS.record(GPT_LOG_FOLDER, "translation_memory", calls_avoided=1)
+        return i, chunk, memory_translation
     things_to_note_prompt = search_things_to_note_in_prompt(chunk, TERMINOLOGY)
+    if memory_prompt:
+        things_to_note_prompt = '\n'.join(p for p in (things_to_note_prompt, memory_prompt) if p)
     previous_content_prompt = get_previous_content(chunks, i)
     after_content_prompt = get_after_content(chunks, i)
-    translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i, GPT_LOG_FOLDER,console)
+    try:
+        translation, english_result = translate_lines(chunk, previous_content_prompt, after_content_prompt, things_to_note_prompt, theme_prompt, i, GPT_LOG_FOLDER,console)
+    except BatchPending:
+        raise
+    except Exception as e:
+        lines = chunk.split('\n')
+        # smaller blocks do not help against a rejected request or an exhausted retry budget, only against a too long one
+        if len(lines) < 2 or is_fail_fast(e):
+            raise
+        if failed_chunks is not None:
+            failed_chunks.append(i)
+        # 🔪 retry the failed chunk as two smaller halves, each keeping the other half as context
+        console.print(f"[yellow]⚠️ Block {i} failed, retrying as two smaller blocks...[/yellow]")
+        half = len(lines) // 2
+        first, second = '\n'.join(lines[:half]), '\n'.join(lines[half:])
+        first_trans, _ = translate_lines(first, previous_content_prompt, lines[half:half + 2], search_things_to_note_in_prompt(first, TERMINOLOGY), theme_prompt, i, GPT_LOG_FOLDER,console)
+        second_trans, _ = translate_lines(second, lines[max(half - 3, 0):half], after_content_prompt, search_things_to_note_in_prompt(second, TERMINOLOGY), theme_prompt, i, GPT_LOG_FOLDER,console)
+        translation, english_result = first_trans + '\n' + second_trans, chunk
+    save_translation_memory(chunk, translation, TERMINOLOGY)
     return i, english_result, translation
 
+# 📦 Prefetch all translations through the batch api (faithfulness round, then expressiveness round)
+def prefetch_with_batch_api(chunks, todo, theme_prompt, TERMINOLOGY, GPT_LOG_FOLDER, BATCH_STATE):
+    """Only the chunks in `todo` are collected, reused chunks are never sent again"""
+    def collect():
+        for i in todo:
+            try:
+                translate_chunk(chunks[i], chunks, theme_prompt, i, TERMINOLOGY, GPT_LOG_FOLDER)
+            except BatchPending:
+                pass
+    run_batched(collect, GPT_LOG_FOLDER, BATCH_STATE)
+
 # Add similarity calculation function
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio()
 
+def source_hash(text):
+    return hashlib.sha1(''.join(text.split('\n')).lower().encode('utf-8')).hexdigest()
+
+# 🔎 Diagnostic fallback: find the result of a chunk by text similarity
+def fuzzy_match_result(i, chunk, results, console):
+    chunk_text = ''.join(chunk.split('\n')).lower()
+    matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) 
+                      for r in results]
+    best_match = max(matching_results, key=lambda x: x[1])
+    
+    # Check similarity and handle exceptions
+    if best_match[1] < 0.9:
+        console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
+        raise ValueError(f"Translation matching failed (chunk {i})")
+    elif best_match[1] < 1.0:
+        console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
+    return best_match[0]
+
+# 🧩 Put the results back in chunk order, checking each one against the hash of its source lines
+def assemble_results(chunks, results, console):
+    by_index = {r[0]: r for r in results}
+    src_text, trans_text = [], []
+    for i, chunk in enumerate(chunks):
+        chunk_lines = chunk.split('\n')
+        src_text.extend(chunk_lines)
+        result = by_index.get(i)
+        if result is None or source_hash(result[1]) != source_hash(chunk):
+            console.print(f"[yellow]Warning: result of chunk {i} does not match its source, falling back to fuzzy matching[/yellow]")
+            result = fuzzy_match_result(i, chunk, results, console)
+        trans_text.extend(result[2].split('\n'))
+    return src_text, trans_text
+
 # 🚀 Main function to translate all chunks
 # @check_file_exists(_4_2_TRANSLATION)
 def translate_all(video_name):
@@ -71,46 +274,61 @@ def translate_all(video_name):
     SPLIT_BY_MEANING = _3_2_SPLIT_BY_MEANING(pathManager)
     CLEANED_CHUNKS = _2_CLEANED_CHUNKS(pathManager)
     GPT_LOG_FOLDER = _GPT_LOG_FOLDER(pathManager)
+    CHUNK_STATE = _4_2_CHUNK_STATE(pathManager)
     console.print("[bold green]Start Translating All...[/bold green]")
-    chunks = split_chunks_by_chars(chunk_size=600, max_i=10, SPLIT_BY_MEANING=SPLIT_BY_MEANING)
+    FINGERPRINTS = _4_2_FINGERPRINTS(pathManager)
+    chunk_scale = load_chunk_scale(CHUNK_STATE)
+    max_tokens = get_chunk_token_budget(chunk_scale)
+    max_i = load_key("translate.max_lines", 20)
+    previous = load_fingerprints(FINGERPRINTS) if load_key("translate.incremental", True) else {"chunks": []}
+    if previous["chunks"]:
+        chunks = reuse_chunk_boundaries(read_sentences(SPLIT_BY_MEANING), [c["source"] for c in previous["chunks"]], max_tokens, max_i)
+    else:
+        chunks = split_chunks_by_tokens(max_tokens, max_i=max_i, SPLIT_BY_MEANING=SPLIT_BY_MEANING)
+    console.print(f"[cyan]📦 {len(chunks)} chunks of up to {max_tokens} tokens (scale {chunk_scale:.2f})[/cyan]")
+    failed_chunks = []
     with open(TERMINOLOGY, 'r', encoding='utf-8') as file:
         theme_prompt = json.load(file).get('theme')
 
+    # ♻️ chunks whose inputs did not change since the last run keep their translation
+    settings = fingerprint_settings()
+    fingerprints = [chunk_fingerprint(chunks, i, theme_prompt, TERMINOLOGY, settings) for i in range(len(chunks))]
+    previous_by_fp, row = {}, 0
+    for previous_chunk in previous["chunks"]:
+        previous_by_fp[previous_chunk["fingerprint"]] = (previous_chunk, row)
+        row += len(previous_chunk["source"].split('\n'))
+    reused = {i: previous_by_fp[fp] for i, fp in enumerate(fingerprints) if fp in previous_by_fp}
+    todo = [i for i in range(len(chunks)) if i not in reused]
+    if reused:
+        console.print(f"[cyan]♻️ {len(reused)} unchanged chunks reused, {len(todo)} to translate[/cyan]")
+
+    if load_key("batch_api.enabled", False) and todo:
+        prefetch_with_batch_api(chunks, todo, theme_prompt, TERMINOLOGY, GPT_LOG_FOLDER, _4_2_BATCH_STATE(pathManager))
+
+    results = [(i, chunks[i], previous_chunk["translation"]) for i, (previous_chunk, _) in reused.items()]
     # 使用线程本地的 Progress
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), console=console, transient=True) as progress:
-        task = progress.add_task("[cyan]Translating chunks...", total=len(chunks))
+        task = progress.add_task("[cyan]Translating chunks...", total=len(todo))
         with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
             futures = []
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(translate_chunk, chunk, chunks, theme_prompt, i,TERMINOLOGY,GPT_LOG_FOLDER)
+            for i in todo:
+                future = executor.submit(translate_chunk, chunks[i], chunks, theme_prompt, i,TERMINOLOGY,GPT_LOG_FOLDER, failed_chunks)
                 futures.append(future)
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                results.append(future.result())
-                progress.update(task, advance=1)
+            done = 0
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    results.append(future.result())
+                    done += 1
+                    progress.update(task, advance=1)
+            finally:
+                # an unfinished run counts every chunk as failed so the retry uses smaller chunks
+                failed = len(failed_chunks) if done == len(todo) else len(todo)
+                if todo:
+                    update_chunk_scale(CHUNK_STATE, chunk_scale, failed, len(todo))
 
-    results.sort(key=lambda x: x[0])  # Sort results based on original order
-    
     # 💾 Save results to lists and Excel file
-    src_text, trans_text = [], []
-    for i, chunk in enumerate(chunks):
-        chunk_lines = chunk.split('\n')
-        src_text.extend(chunk_lines)
-        
-        # Calculate similarity between current chunk and translation results
-        chunk_text = ''.join(chunk_lines).lower()
-        matching_results = [(r, similar(''.join(r[1].split('\n')).lower(), chunk_text)) 
-                          for r in results]
-        best_match = max(matching_results, key=lambda x: x[1])
-        
-        # Check similarity and handle exceptions
-        if best_match[1] < 0.9:
-            console.print(f"[yellow]Warning: No matching translation found for chunk {i}[/yellow]")
-            raise ValueError(f"Translation matching failed (chunk {i})")
-        elif best_match[1] < 1.0:
-            console.print(f"[yellow]Warning: Similar match found (chunk {i}, similarity: {best_match[1]:.3f})[/yellow]")
-            
-        trans_text.extend(best_match[0][2].split('\n'))
+    src_text, trans_text = assemble_results(chunks, results, console)
+    translations = [r[2] for r in sorted(results, key=lambda r: r[0])]
     
     # Trim long translation text
     df_text = pd.read_excel(CLEANED_CHUNKS)
@@ -120,11 +338,32 @@ def translate_all(video_name):
     df_time = align_timestamp(df_text, df_translate, subtitle_output_configs, output_dir=None, for_display=False)
     # 使用线程本地的 console 进行输出
     console.print(df_time)
-    df_time['Translation'] = df_time.apply(lambda x: check_len_then_trim(x['Translation'], x['duration'],console) if x['duration'] > load_key("min_trim_duration") else x['Translation'], axis=1)
+    changed = pd.Series(True, index=df_time.index)
+    # splice the final (trimmed) rows of the reused chunks from the previous results, trim only the rest
+    if reused and os.path.exists(TRANSLATION):
+        old_rows = pd.read_excel(TRANSLATION)
+        if len(old_rows) == row:
+            row_index = 0
+            for i, chunk in enumerate(chunks):
+                n_lines = len(chunk.split('\n'))
+                if i in reused:
+                    old_start = reused[i][1]
+                    df_time.loc[row_index:row_index + n_lines - 1, 'Translation'] = old_rows['Translation'].iloc[old_start:old_start + n_lines].values
+                    changed.loc[row_index:row_index + n_lines - 1] = False
+                row_index += n_lines
+    dirty = df_time.index[changed].tolist()
+    df_time.loc[dirty, 'Translation'] = trim_subtitles(df_time.loc[dirty, 'Translation'], df_time.loc[dirty, 'duration'], GPT_LOG_FOLDER, console)
     console.print(df_time)
     
     df_time.to_excel(TRANSLATION, index=False)
+    save_fingerprints(FINGERPRINTS, chunks, fingerprints, translations)
+    console.print(f"[cyan]📝 {len(dirty)}/{len(df_time)} rows translated and trimmed in this run[/cyan]")
     console.print("[bold green]✅ Translation completed and results saved.[/bold green]")
+    memory = get_translation_memory()
+    if memory is not None:
+        stats = memory.stats()
+        console.print(f"[cyan]📚 Translation memory: {stats['entries']} entries, exact hit rate {stats['exact_hit_rate']:.0%}, "
+                      f"hit rate incl. fuzzy {stats['hit_rate']:.0%}[/cyan]")
 
 if __name__ == '__main__':
     translate_all("28679343296-1-16")
\ No newline at end of file
@@ -1,9 +1,10 @@
 import datetime
 import re
+import concurrent.futures
 import pandas as pd
 from rich.console import Console
 from rich.panel import Panel
-from core.prompts import get_subtitle_trim_prompt
+from core.prompts import get_subtitle_trim_prompt, get_subtitle_batch_trim_prompt
 from core.tts_backend.estimate_duration import init_estimator, estimate_duration
 from core.utils import *
 # 为每个线程创建一个 Console 实例
@@ -22,12 +23,17 @@ def get_estimator():
         thread_local.estimator = init_estimator()
     return thread_local.estimator
 
-def check_len_then_trim(text, duration,console):
+def estimate_reading_duration(text):
+    return estimate_duration(text, get_estimator()) / speed_factor['max']
+
+def trim_by_removing_punctuation(text):
+    return re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
+
+def check_len_then_trim(text, duration,console,GPT_LOG_FOLDER=None):
     # global ESTIMATOR
     # if ESTIMATOR is None:
     #     ESTIMATOR = init_estimator()
-    ESTIMATOR = get_estimator()
-    estimated_duration = estimate_duration(text, ESTIMATOR) / speed_factor['max']
+    estimated_duration = estimate_reading_duration(text)
     
     console.print(f"Subtitle text: {text}, "
                   f"[bold green]Estimated reading duration: {estimated_duration:.2f} seconds[/bold green]")
@@ -41,16 +47,73 @@ def check_len_then_trim(text, duration,console):
                 return {'status': 'error', 'message': 'No result in response'}
             return {'status': 'success', 'message': ''}
         try:    
-            response = ask_gpt(prompt, resp_type='json', log_title='sub_trim', valid_def=valid_trim)
+            response = ask_gpt(prompt, resp_type='json', log_title='sub_trim', valid_def=valid_trim, GPT_LOG_FOLDER=GPT_LOG_FOLDER)
             shortened_text = response['result']
         except Exception:
             console.print("[bold red]🚫 AI refused to answer due to sensitivity, so manually remove punctuation[/bold red]")
-            shortened_text = re.sub(r'[,.!?;:，。！？；：]', ' ', text).strip()
+            shortened_text = trim_by_removing_punctuation(text)
         console.print(Panel(f"Subtitle before shortening: {original_text}\nSubtitle after shortening: {shortened_text}", title="Subtitle Shortening Result", border_style="green"))
         return shortened_text
     else:
         return text
 
+# ------------
+# trim many subtitles
+# ------------
+
+def trim_batch(items, GPT_LOG_FOLDER):
+    """Shorten several (text, duration) subtitles in one request, return {position: shortened text}
+    for the lines that came back valid; the caller trims the others one by one"""
+    def valid_batch(response):
+        if not isinstance(response, dict) or not any(str(i) in response for i in range(1, len(items) + 1)):
+            return {'status': 'error', 'message': 'No numbered results in response'}
+        return {'status': 'success', 'message': ''}
+    try:
+        response = ask_gpt(get_subtitle_batch_trim_prompt(items), resp_type='json', log_title='sub_trim_batch',
+                           valid_def=valid_batch, GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+    except Exception:
+        return {}
+    trimmed = {}
+    for i, (text, duration) in enumerate(items):
+        entry = response.get(str(i + 1))
+        result = entry.get('result') if isinstance(entry, dict) else None
+        # per line: a non-empty answer that is actually shorter than the original
+        if isinstance(result, str) and result.strip() and len(result.strip()) < len(text):
+            trimmed[i] = result.strip()
+    return trimmed
+
+def trim_subtitles(texts, durations, GPT_LOG_FOLDER=None, console=None):
+    """Trim every subtitle whose estimated reading time exceeds its duration.
+
+    Runs on a pool of `max_workers` threads. With `sub_trim.batch_size` > 1 the over-long lines are
+    shortened `batch_size` per request; lines missing or invalid in a batch answer are trimmed alone."""
+    console = console or get_console()
+    texts = list(texts)
+    durations = list(durations)
+    min_trim_duration = load_key("min_trim_duration")
+    candidates = [i for i, duration in enumerate(durations) if duration > min_trim_duration]
+    batch_size = load_key("sub_trim.batch_size", 0)
+    results = list(texts)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=load_key("max_workers")) as executor:
+        if batch_size > 1:
+            estimates = dict(zip(candidates, executor.map(lambda i: estimate_reading_duration(texts[i]), candidates)))
+            too_long = [i for i in candidates if estimates[i] > durations[i]]
+            batches = [too_long[k:k + batch_size] for k in range(0, len(too_long), batch_size)]
+            answers = executor.map(lambda batch: trim_batch([(texts[i], durations[i]) for i in batch], GPT_LOG_FOLDER), batches)
+            leftovers = []
+            for batch, trimmed in zip(batches, answers):
+                for position, i in enumerate(batch):
+                    if position in trimmed:
+                        results[i] = trimmed[position]
+                    else:
+                        leftovers.append(i)
+            console.print(f"[cyan]✂️ Trimmed {len(too_long) - len(leftovers)}/{len(too_long)} subtitles in {len(batches)} batched requests[/cyan]")
+            candidates = leftovers
+        trimmed = executor.map(lambda i: check_len_then_trim(texts[i], durations[i], console, GPT_LOG_FOLDER), candidates)
+        for i, text in zip(candidates, trimmed):
+            results[i] = text
+    return results
+
 def time_diff_seconds(t1, t2, base_date):
     """Calculate the difference in seconds between two time objects"""
     dt1 = datetime.datetime.combine(base_date, t1)
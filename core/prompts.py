@@ -123,6 +123,50 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 """.strip()
     return summary_prompt
 
+def get_summary_reduce_prompt(themes, terms, conflicts, max_terms):
+    """Merge the per-shard summaries of a long video: `conflicts` maps a term to its differing translations"""
+    src_lang = load_key("whisper.detected_language")
+    tgt_lang = load_key("target_language")
+    themes_text = "\n".join(f"{i}. {theme}" for i, theme in enumerate(themes, 1))
+    terms_text = "\n".join(f"- {term['src']}: {term['tgt']} ({term['note']})" for term in terms)
+    conflicts_text = "\n".join(f"- {src}: {' / '.join(tgts)}" for src, tgts in conflicts.items()) or "None"
+
+    reduce_prompt = f"""
+## Role
+You are a video translation expert and terminology consultant, specializing in {src_lang} comprehension and {tgt_lang} expression optimization.
+
+## Task
+The video was summarized part by part. Merge the partial results:
+1. Write one two-sentence summary of the whole video from the partial summaries
+2. Keep the most important terms (at most {max_terms}), choosing one {tgt_lang} translation for every conflicting term
+
+## INPUT
+### Partial Summaries (in video order)
+{themes_text}
+
+### Terms
+{terms_text}
+
+### Conflicting Translations
+{conflicts_text}
+
+## Output in only JSON format and no other text
+{{
+  "theme": "Two-sentence video summary",
+  "terms": [
+    {{
+      "src": "{src_lang} term",
+      "tgt": "{tgt_lang} translation or original",
+      "note": "Brief explanation"
+    }},
+    ...
+  ]
+}}
+
+Note: Start you answer with ```json and end with ```, do not add any other text.
+""".strip()
+    return reduce_prompt
+
 ## ================================================================
 # @ step5_translate.py & translate_lines.py
 def generate_shared_prompt(previous_content_prompt, after_content_prompt, summary_prompt, things_to_note_prompt):
@@ -299,14 +343,16 @@ Note: Start you answer with ```json and end with ```, do not add any other text.
 
 ## ================================================================
 # @ step8_gen_audio_task.py @ step10_gen_audio.py
-def get_subtitle_trim_prompt(text, duration):
- 
-    rule = '''Consider a. Reducing filler words without modifying meaningful content. b. Omitting unnecessary modifiers or pronouns, for example:
+SUBTITLE_TRIM_RULE = '''Consider a. Reducing filler words without modifying meaningful content. b. Omitting unnecessary modifiers or pronouns, for example:
     - "Please explain your thought process" can be shortened to "Please explain thought process"
     - "We need to carefully analyze this complex problem" can be shortened to "We need to analyze this problem"
     - "Let's discuss the various different perspectives on this topic" can be shortened to "Let's discuss different perspectives on this topic"
     - "Can you describe in detail your experience from yesterday" can be shortened to "Can you describe yesterday's experience" '''
 
+def get_subtitle_trim_prompt(text, duration):
+ 
+    rule = SUBTITLE_TRIM_RULE
+
     trim_prompt = f'''
 ## Role
 You are a professional subtitle editor, editing and optimizing lengthy subtitles that exceed voiceover time before handing them to voice actors. 
@@ -334,6 +380,37 @@ Please follow these steps and provide the results in the JSON output:
 }}
 ```
 
+Note: Start you answer with ```json and end with ```, do not add any other text.
+'''.strip()
+    return trim_prompt
+
+def get_subtitle_batch_trim_prompt(items):
+    """`items` is a list of (text, duration), answered by line number like the translation prompts"""
+    subtitles = '\n'.join(f'{i}. Subtitle: "{text}" | Duration: {duration} seconds' for i, (text, duration) in enumerate(items, 1))
+    result_json = ',\n    '.join(f'"{i}": {{"result": "Optimized and shortened subtitle {i} in the original subtitle language"}}'
+                                  for i in range(1, len(items) + 1))
+
+    trim_prompt = f'''
+## Role
+You are a professional subtitle editor, editing and optimizing lengthy subtitles that exceed voiceover time before handing them to voice actors. 
+Your expertise lies in cleverly shortening subtitles slightly while ensuring the original meaning and structure remain unchanged.
+
+## INPUT
+Each subtitle is independent, shorten each one so it can be read within its own duration.
+<subtitles>
+{subtitles}
+</subtitles>
+
+## Processing Rules
+{SUBTITLE_TRIM_RULE}
+
+## Output in only JSON format and no other text
+```json
+{{
+    {result_json}
+}}
+```
+
 Note: Start you answer with ```json and end with ```, do not add any other text.
 '''.strip()
     return trim_prompt
@@ -2,12 +2,17 @@ from .split_by_comma import split_by_comma_main
 from .split_by_connector import split_sentences_main
 from .split_by_mark import split_by_mark
 from .split_long_by_root import split_long_by_root_main
-from .load_nlp_model import init_nlp
+from .load_nlp_model import init_nlp, release_nlp, PARSE_PIPES, TOKENIZER_ONLY
+from .split_pipeline import split_by_nlp_pipeline
 
 __all__ = [
     "split_by_comma_main",
     "split_sentences_main",
     "split_by_mark",
     "split_long_by_root_main",
-    "init_nlp"
+    "init_nlp",
+    "release_nlp",
+    "PARSE_PIPES",
+    "TOKENIZER_ONLY",
+    "split_by_nlp_pipeline"
 ]
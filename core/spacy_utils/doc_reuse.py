@@ -0,0 +1,21 @@
+# ------------
+# reuse a parse across the split stages
+# ------------
+
+def reuse_parse(nlp, span, text=None):
+    """Standalone Doc for `text` (default: the stripped span text).
+
+    The annotations of `span` are copied with `as_doc()` when it still covers `text` exactly,
+    so a part produced by a split is not parsed again. Only a changed text goes through `nlp`."""
+    text = span.text.strip() if text is None else text
+    if len(span) and span.text.strip() == text and not span[0].is_space and not span[-1].is_space:
+        return span.as_doc()
+    return nlp(text)
+
+def doc_texts(docs):
+    return [doc.text.strip() for doc in docs]
+
+def write_sentences(path, sentences):
+    """Write one sentence per line (intermediate split results, debug output only)"""
+    with open(path, "w", encoding="utf-8") as output_file:
+        output_file.write("\n".join(sentences))
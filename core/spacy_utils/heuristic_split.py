@@ -0,0 +1,66 @@
+import warnings
+from core.spacy_utils.split_by_comma import is_valid_phrase
+
+warnings.filterwarnings("ignore", category=FutureWarning)
+
+# ------------
+# local split proposals for long sentences
+# ------------
+# Every token boundary gets a score for how safe a cut before it is, read from the dependency
+# parse. A DP picks the cuts that give the fewest parts within the length limits, preferring
+# the best weakest cut. The weakest chosen cut is the confidence: above the threshold the
+# split is used directly, below it the sentence goes to the llm.
+
+COMMAS = (",", "，", "、", ";", "；")
+CLAUSE_DEPS = ("advcl", "ccomp", "conj", "parataxis", "relcl", "acl:relcl")
+
+def score_cut(doc, i):
+    """How safe it is to cut right before doc[i], 0 means never"""
+    token, previous = doc[i], doc[i - 1]
+    if token.is_punct or previous.text in ("'", '"', "-") or token.text.startswith("'"):
+        return 0.0
+    if i > 0 and token.is_sent_start:
+        return 0.95
+    left_has_verb = any(t.pos_ in ("VERB", "AUX") for t in doc[max(0, i - 12):i])
+    right = doc[i:min(len(doc), i + 10)]
+    if previous.text in COMMAS:
+        return 0.85 if is_valid_phrase(right) and left_has_verb else 0.55
+    if token.pos_ in ("CCONJ", "SCONJ") or token.dep_ in ("cc", "mark"):
+        if left_has_verb and token.head.pos_ in ("VERB", "AUX") and is_valid_phrase(right):
+            return 0.9
+        return 0.4
+    if token.dep_ in CLAUSE_DEPS and token.left_edge.i == i and token.pos_ in ("VERB", "AUX") and left_has_verb:
+        return 0.75
+    if previous.is_punct:
+        return 0.3
+    return 0.0
+
+def propose_split(doc, max_length, min_length=3):
+    """Return (parts, confidence) for a doc longer than `max_length` tokens, or (None, 0.0)"""
+    n = len(doc)
+    scores = [0.0] + [score_cut(doc, i) for i in range(1, n)] + [1.0]
+    INF = float('inf')
+    # best[i] = (parts, -weakest cut) for doc[:i] ending with a cut before i
+    best = [(INF, 0.0)] * (n + 1)
+    prev = [0] * (n + 1)
+    best[0] = (0, -1.0)
+    for i in range(1, n + 1):
+        if scores[i] <= 0:
+            continue
+        for j in range(max(0, i - max_length), i - min_length + 1):
+            if best[j][0] == INF:
+                continue
+            candidate = (best[j][0] + 1, max(best[j][1], -scores[i]))
+            if candidate < best[i]:
+                best[i] = candidate
+                prev[i] = j
+    if best[n][0] == INF or best[n][0] < 2:
+        return None, 0.0
+    cuts = []
+    i = n
+    while i > 0:
+        cuts.append(i)
+        i = prev[i]
+    cuts = [0] + cuts[::-1]
+    parts = [doc[a:b].text.strip() for a, b in zip(cuts, cuts[1:])]
+    return parts, -best[n][1]
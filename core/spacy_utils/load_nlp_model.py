@@ -1,4 +1,7 @@
+import time
+from threading import Lock
 import spacy
+from rich.console import Console
 from spacy.cli import download
 from core.utils import load_key, except_handler
 
@@ -10,20 +13,87 @@ def get_spacy_model(language: str,console):
         console.print(f"[yellow]Spacy model does not support '{language}', using en_core_web_md model as fallback...[/yellow]")
     return model
 
+# ------------
+# shared model registry
+# ------------
+# One loaded pipeline per (model, excluded components) for the whole process, shared by the
+# stages and by the videos processed in parallel. A stage passes the components it needs,
+# everything else is excluded at load time (not just disabled) so it takes no memory.
+
+# dependency parse, sentence boundaries and POS for the split stages
+PARSE_PIPES = frozenset(["tok2vec", "transformer", "tagger", "morphologizer", "attribute_ruler", "parser", "senter"])
+# token counts only
+TOKENIZER_ONLY = frozenset()
+
+class NLPRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        self._models = {}
+        self._refs = {}
+        self._load_locks = {}
+
+    def _excluded(self, model, needs):
+        if needs is None:
+            return ()
+        meta = spacy.util.get_model_meta(spacy.util.get_package_path(model))
+        components = meta.get("components") or meta.get("pipeline") or []
+        return tuple(sorted(c for c in components if c not in needs))
+
+    def _load(self, model, needs, console):
+        try:
+            excluded = self._excluded(model, needs)
+        except Exception:
+            console.print(f"[yellow]Downloading {model} model...[/yellow]")
+            console.print("[yellow]If download failed, please check your network and try again.[/yellow]")
+            download(model)
+            excluded = self._excluded(model, needs)
+        key = (model, excluded)
+        with self.lock:
+            load_lock = self._load_locks.setdefault(key, Lock())
+        # only the first caller loads, concurrent videos wait for it instead of loading a copy
+        with load_lock:
+            with self.lock:
+                if key in self._models:
+                    self._refs[key] += 1
+                    return self._models[key]
+            console.print(f"[blue]⏳ Loading NLP Spacy model: <{model}> (excluded: {list(excluded) or 'none'}) ...[/blue]")
+            start = time.perf_counter()
+            nlp = spacy.load(model, exclude=list(excluded))
+            console.print(f"[green]✅ NLP Spacy model loaded successfully in {time.perf_counter() - start:.1f}s![/green]")
+            with self.lock:
+                self._models[key] = nlp
+                self._refs[key] = 1
+            return nlp
+
+    def acquire(self, model, needs=None, console=None):
+        """Return the shared pipeline of `model` with only the components in `needs` (all if None)"""
+        return self._load(model, needs, console or Console())
+
+    def release(self, nlp):
+        """Drop a reference, the pipeline is unloaded at zero only with `spacy_pipeline.unload_idle`"""
+        with self.lock:
+            for key, loaded in self._models.items():
+                if loaded is nlp:
+                    self._refs[key] -= 1
+                    if self._refs[key] <= 0 and load_key("spacy_pipeline.unload_idle", False):
+                        del self._models[key], self._refs[key]
+                    return
+
+    def loaded(self):
+        with self.lock:
+            return {f"{model} -{list(excluded)}": self._refs[(model, excluded)] for model, excluded in self._models}
+
+NLP_MODELS = NLPRegistry()
+
 @except_handler("Failed to load NLP Spacy model")
-def init_nlp(console):
+def init_nlp(console, needs=None):
+    """Acquire the shared spaCy model for the video language, call `release_nlp` when the stage is done"""
     language = "en" if load_key("whisper.language") == "en" else load_key("whisper.detected_language")
     model = get_spacy_model(language,console)
-    console.print(f"[blue]⏳ Loading NLP Spacy model: <{model}> ...[/blue]")
-    try:
-        nlp = spacy.load(model)
-    except:
-        console.print(f"[yellow]Downloading {model} model...[/yellow]")
-        console.print("[yellow]If download failed, please check your network and try again.[/yellow]")
-        download(model)
-        nlp = spacy.load(model)
-    console.print("[green]✅ NLP Spacy model loaded successfully![/green]")
-    return nlp
+    return NLP_MODELS.acquire(model, needs, console)
+
+def release_nlp(nlp):
+    NLP_MODELS.release(nlp)
 
 # # --------------------
 # # define the intermediate files
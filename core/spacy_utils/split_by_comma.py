@@ -1,6 +1,7 @@
 import itertools
 import os
 import warnings
+from core.spacy_utils.doc_reuse import reuse_parse
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -25,9 +26,9 @@ def analyze_comma(start, doc, token):
 
     return suitable_for_splitting
 
-def split_by_comma(text, nlp,console):
-    doc = nlp(text)
-    sentences = []
+def split_doc_by_comma(doc, console):
+    """Split a parsed doc at suitable commas, returning the parts as spans of `doc`"""
+    spans = []
     start = 0
     
     for i, token in enumerate(doc):
@@ -35,12 +36,19 @@ def split_by_comma(text, nlp,console):
             suitable_for_splitting = analyze_comma(start, doc, token)
             
             if suitable_for_splitting:
-                sentences.append(doc[start:token.i].text.strip())
+                spans.append(doc[start:token.i])
                 console.print(f"[yellow]✂️  Split at comma: {doc[start:token.i][-4:]},| {doc[token.i + 1:][:4]}[/yellow]")
                 start = token.i + 1
     
-    sentences.append(doc[start:].text.strip())
-    return sentences
+    spans.append(doc[start:])
+    return spans
+
+def split_by_comma(text, nlp,console):
+    return [span.text.strip() for span in split_doc_by_comma(nlp(text), console)]
+
+def split_docs_by_comma(docs, nlp, console):
+    """In-memory comma stage: a part keeps the parse of its sentence unless its text changed"""
+    return [reuse_parse(nlp, span) for doc in docs for span in split_doc_by_comma(doc, console)]
 
 def split_by_comma_main(nlp,SPLIT_BY_COMMA_FILE, SPLIT_BY_MARK_FILE,console):
 
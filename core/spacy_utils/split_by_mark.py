@@ -1,11 +1,50 @@
-import os
 import pandas as pd
 import warnings
 from core.utils.config_utils import load_key, get_joiner
+from core.spacy_utils.doc_reuse import reuse_parse, doc_texts, write_sentences
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-def split_by_mark(nlp,CLEANED_CHUNKS,SPLIT_BY_MARK_FILE,console):
+SENTENCE_ENDS = ('.', '?', '!', '。', '？', '！')
+
+def shard_chunks(chunks, shard_words, min_gap):
+    """Cut the ASR words into shards of about `shard_words` words for parallel parsing.
+
+    A shard only ends after a sentence end followed by a pause of at least `min_gap` seconds,
+    and never before a `-`/`...` continuation or a lone punctuation mark, so no sentence
+    (and no merge below) crosses two shards."""
+    texts = [str(text) for text in chunks.text.to_list()]
+    has_times = 'start' in chunks.columns and 'end' in chunks.columns
+    shards = []
+    start = 0
+    for i in range(1, len(texts)):
+        if i - start < shard_words:
+            continue
+        previous, word = texts[i - 1].strip(), texts[i].strip()
+        if not previous.endswith(SENTENCE_ENDS) or previous.endswith('...'):
+            continue
+        if word.startswith(('-', '...')) or all(char in SENTENCE_ENDS + (',', '，') for char in word):
+            continue
+        if has_times and chunks.start.iloc[i] - chunks.end.iloc[i - 1] < min_gap:
+            continue
+        shards.append(texts[start:i])
+        start = i
+    shards.append(texts[start:])
+    return shards
+
+def parse_transcript(nlp, chunks, joiner, console):
+    """Parse the joined transcript, in shards over `spacy_pipeline.n_process` processes if configured"""
+    n_process = load_key("spacy_pipeline.n_process", 1)
+    if n_process <= 1:
+        return [nlp(joiner.join(chunks.text.to_list()))]
+    shards = shard_chunks(chunks, load_key("spacy_pipeline.shard_words", 2000), load_key("spacy_pipeline.shard_gap", 0.5))
+    console.print(f"[blue]⚡ Parsing {len(shards)} shards with {n_process} processes[/blue]")
+    # nlp.pipe keeps the input order, so the sentences are stitched back in transcript order
+    return list(nlp.pipe([joiner.join(shard) for shard in shards],
+                         batch_size=load_key("spacy_pipeline.batch_size", 1), n_process=n_process))
+
+def split_docs_by_mark(nlp,CLEANED_CHUNKS,console):
+    """Parse the transcript once and split it by punctuation marks, returning one Doc per sentence"""
     whisper_language = load_key("whisper.language")
     language = load_key("whisper.detected_language") if whisper_language == 'auto' else whisper_language # consider force english case
     joiner = get_joiner(language)
@@ -13,18 +52,15 @@ def split_by_mark(nlp,CLEANED_CHUNKS,SPLIT_BY_MARK_FILE,console):
     chunks = pd.read_excel(CLEANED_CHUNKS)
     chunks.text = chunks.text.apply(lambda x: x.strip('"').strip(""))
     
-    # join with joiner
-    input_text = joiner.join(chunks.text.to_list())
-
-    doc = nlp(input_text)
-    assert doc.has_annotation("SENT_START")
+    docs = parse_transcript(nlp, chunks, joiner, console)
+    assert all(doc.has_annotation("SENT_START") for doc in docs)
 
     # skip - and ...
-    sentences_by_mark = []
+    sentences_by_mark = []  # [text, doc, start, end] with doc[start:end] covering the text
     current_sentence = []
     
     # iterate all sentences
-    for sent in doc.sents:
+    for doc, sent in ((doc, sent) for doc in docs for sent in doc.sents):
         text = sent.text.strip()
         
         # check if the current sentence ends with - or ...
@@ -35,25 +71,39 @@ def split_by_mark(nlp,CLEANED_CHUNKS,SPLIT_BY_MARK_FILE,console):
             current_sentence[-1].endswith('...')
         ):
             current_sentence.append(text)
+            _extend(sentences_by_mark[-1], doc, sent.end)
         else:
             if current_sentence:
-                sentences_by_mark.append(' '.join(current_sentence))
+                sentences_by_mark[-1][0] = ' '.join(current_sentence)
                 current_sentence = []
             current_sentence.append(text)
+            sentences_by_mark.append([text, doc, sent.start, sent.end])
     
     # add the last sentence
     if current_sentence:
-        sentences_by_mark.append(' '.join(current_sentence))
-
-    with open(SPLIT_BY_MARK_FILE, "w", encoding="utf-8") as output_file:
-        for i, sentence in enumerate(sentences_by_mark):
-            if i > 0 and sentence.strip() in [',', '.', '，', '。', '？', '！']:
-                # ! If the current line contains only punctuation, merge it with the previous line, this happens in Chinese, Japanese, etc.
-                output_file.seek(output_file.tell() - 1, os.SEEK_SET)  # Move to the end of the previous line
-                output_file.write(sentence)  # Add the punctuation
-            else:
-                output_file.write(sentence + "\n")
-    
+        sentences_by_mark[-1][0] = ' '.join(current_sentence)
+
+    merged = []
+    for i, item in enumerate(sentences_by_mark):
+        if i > 0 and item[0].strip() in [',', '.', '，', '。', '？', '！']:
+            # ! If the current line contains only punctuation, merge it with the previous line, this happens in Chinese, Japanese, etc.
+            merged[-1][0] += item[0]
+            _extend(merged[-1], item[1], item[3])
+        else:
+            merged.append(item)
+
+    return [reuse_parse(nlp, doc[start:end], text) if doc is not None else nlp(text) for text, doc, start, end in merged]
+
+def _extend(item, doc, end):
+    # a merge across two shards has no single span, the text is parsed again
+    if item[1] is doc:
+        item[3] = end
+    else:
+        item[1] = None
+
+def split_by_mark(nlp,CLEANED_CHUNKS,SPLIT_BY_MARK_FILE,console):
+    docs = split_docs_by_mark(nlp, CLEANED_CHUNKS, console)
+    write_sentences(SPLIT_BY_MARK_FILE, doc_texts(docs))
     console.print(f"[green]💾 Sentences split by punctuation marks saved to →  `{SPLIT_BY_MARK_FILE}`[/green]")
 
 if __name__ == "__main__":
@@ -60,22 +60,23 @@ def split_extremely_long_sentence(doc):
     return sentences
 
 
-def split_long_by_root_main(nlp,SPLIT_BY_CONNECTOR_FILE,SPLIT_BY_NLP,console):
-    with open(SPLIT_BY_CONNECTOR_FILE, "r", encoding="utf-8") as input_file:
-        sentences = input_file.readlines()
-
+def split_docs_by_root(docs, nlp, console):
+    """Split the docs longer than 60 tokens at verbs/roots, returning the sentences as text"""
     all_split_sentences = []
-    for sentence in sentences:
-        doc = nlp(sentence.strip())
+    for doc in docs:
+        sentence = doc.text.strip()
         if len(doc) > 60:
             split_sentences = split_long_sentence(doc)
+            # the parts are rebuilt from tokens with the joiner, so they have to be parsed again
             if any(len(nlp(sent)) > 60 for sent in split_sentences):
                 split_sentences = [subsent for sent in split_sentences for subsent in split_extremely_long_sentence(nlp(sent))]
             all_split_sentences.extend(split_sentences)
             console.print(f"[yellow]✂️  Splitting long sentences by root: {sentence[:30]}...[/yellow]")
         else:
-            all_split_sentences.append(sentence.strip())
+            all_split_sentences.append(sentence)
+    return all_split_sentences
 
+def write_split_by_nlp(all_split_sentences, SPLIT_BY_NLP, console):
     punctuation = string.punctuation + "'" + '"'  # include all punctuation and apostrophe ' and "
 
     with open(SPLIT_BY_NLP, "w", encoding="utf-8") as output_file:
@@ -88,6 +89,13 @@ def split_long_by_root_main(nlp,SPLIT_BY_CONNECTOR_FILE,SPLIT_BY_NLP,console):
                 continue
             output_file.write(sentence + "\n")
 
+def split_long_by_root_main(nlp,SPLIT_BY_CONNECTOR_FILE,SPLIT_BY_NLP,console):
+    with open(SPLIT_BY_CONNECTOR_FILE, "r", encoding="utf-8") as input_file:
+        sentences = input_file.readlines()
+
+    all_split_sentences = split_docs_by_root(nlp.pipe([sentence.strip() for sentence in sentences]), nlp, console)
+    write_split_by_nlp(all_split_sentences, SPLIT_BY_NLP, console)
+
     # delete the original file
     os.remove(SPLIT_BY_CONNECTOR_FILE)   
 
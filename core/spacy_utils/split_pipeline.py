@@ -0,0 +1,36 @@
+from core.utils.config_utils import load_key
+from core.spacy_utils.doc_reuse import doc_texts, write_sentences
+from core.spacy_utils.split_by_mark import split_docs_by_mark
+from core.spacy_utils.split_by_comma import split_docs_by_comma
+from core.spacy_utils.split_by_connector import split_docs_by_connectors
+from core.spacy_utils.split_long_by_root import split_docs_by_root, write_split_by_nlp
+
+# ------------
+# parse once, split in memory
+# ------------
+# The transcript is parsed once in split_by_mark; every later stage works on the Docs of the
+# previous one and only re-parses text it actually rebuilt. The per-stage files are written
+# only with `spacy_pipeline.debug_files`.
+
+def split_by_nlp_pipeline(nlp, CLEANED_CHUNKS, SPLIT_BY_NLP, console, debug_files=None):
+    """`debug_files`: optional {"mark": path, "comma": path, "connector": path} for the intermediate results"""
+    if debug_files is None or not load_key("spacy_pipeline.debug_files", False):
+        debug_files = {}
+
+    docs = split_docs_by_mark(nlp, CLEANED_CHUNKS, console)
+    if "mark" in debug_files:
+        write_sentences(debug_files["mark"], doc_texts(docs))
+    console.print(f"[green]✅ Split by punctuation marks: {len(docs)} sentences[/green]")
+
+    docs = split_docs_by_comma(docs, nlp, console)
+    if "comma" in debug_files:
+        write_sentences(debug_files["comma"], doc_texts(docs))
+    console.print(f"[green]✅ Split by commas: {len(docs)} sentences[/green]")
+
+    docs = split_docs_by_connectors(docs, nlp, console)
+    if "connector" in debug_files:
+        write_sentences(debug_files["connector"], doc_texts(docs))
+    console.print(f"[green]✅ Split by connectors: {len(docs)} sentences[/green]")
+
+    write_split_by_nlp(split_docs_by_root(docs, nlp, console), SPLIT_BY_NLP, console)
+    console.print(f"[green]💾 Long sentences split by root saved to →  {SPLIT_BY_NLP}[/green]")
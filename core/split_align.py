@@ -0,0 +1,84 @@
+# ------------
+# map the `[br]` marks of an llm split back onto the original sentence
+# ------------
+# Both texts are normalized (whitespace dropped, lowercased) while keeping an offset map
+# back to the original. When the llm only inserted `[br]`, the normalized texts are equal
+# and every mark maps directly (O(n)). Otherwise a banded edit-distance alignment is used,
+# which is O(n * band) instead of one SequenceMatcher per candidate index.
+
+def _normalize(text):
+    chars, offsets = [], []
+    for i, char in enumerate(text):
+        if char.isspace():
+            continue
+        lower = char.lower()
+        chars.append(lower if len(lower) == 1 else char)
+        offsets.append(i)
+    return ''.join(chars), offsets
+
+def _banded_alignment(a, b, band):
+    """For every prefix length j of b, return the prefix length of a it aligns to (edit distance, banded)"""
+    n, m = len(a), len(b)
+    INF = n + m + 1
+    lo = [max(0, (j * n) // max(m, 1) - band) for j in range(m + 1)]
+    hi = [min(n, (j * n) // max(m, 1) + band) for j in range(m + 1)]
+    lo[0], hi[m] = 0, n
+    cost = []
+    for j in range(m + 1):
+        row = [INF] * (hi[j] - lo[j] + 1)
+        for i in range(lo[j], hi[j] + 1):
+            if j == 0:
+                best = i
+            else:
+                best = INF
+                prev_lo, prev_hi = lo[j - 1], hi[j - 1]
+                if prev_lo <= i <= prev_hi:
+                    best = cost[j - 1][i - prev_lo] + 1  # b[j-1] inserted
+                if i > 0 and prev_lo <= i - 1 <= prev_hi:
+                    best = min(best, cost[j - 1][i - 1 - prev_lo] + (a[i - 1] != b[j - 1]))
+                if i > lo[j]:
+                    best = min(best, row[i - 1 - lo[j]] + 1)  # a[i-1] deleted
+            row[i - lo[j]] = best
+        cost.append(row)
+
+    # backtrace from (n, m), keeping the smallest a-prefix reached for every b-prefix. Deletions
+    # win ties, so text the llm dropped at a part boundary goes with the following part,
+    # as with the legacy scan.
+    mapping = list(range(m + 1)) if n == 0 else [n] * (m + 1)
+    i, j = n, m
+    while j > 0:
+        here = cost[j][i - lo[j]]
+        prev_lo, prev_hi = lo[j - 1], hi[j - 1]
+        if i > lo[j] and here == cost[j][i - 1 - lo[j]] + 1:
+            i -= 1
+        elif i > 0 and prev_lo <= i - 1 <= prev_hi and here == cost[j - 1][i - 1 - prev_lo] + (a[i - 1] != b[j - 1]):
+            i, j = i - 1, j - 1
+        else:
+            j -= 1
+        mapping[j] = min(mapping[j], i)
+    return mapping, cost[m][n - lo[m]]
+
+def align_split_positions(original, modified, band=32):
+    """Return (split positions in `original`, similarity) for the `[br]` marks in `modified`"""
+    orig_norm, offsets = _normalize(original)
+    parts = [_normalize(part)[0] for part in modified.split('[br]')]
+    mod_norm = ''.join(parts)
+    boundaries = []
+    total = 0
+    for part in parts[:-1]:
+        total += len(part)
+        boundaries.append(total)
+
+    if orig_norm == mod_norm:
+        mapping, similarity = None, 1.0
+    else:
+        mapping, distance = _banded_alignment(orig_norm, mod_norm, band + abs(len(orig_norm) - len(mod_norm)))
+        similarity = 1 - distance / max(len(orig_norm), len(mod_norm), 1)
+
+    positions = []
+    for boundary in boundaries:
+        norm_pos = boundary if mapping is None else mapping[boundary]
+        # split right after the last character of the left part, like the legacy scan did
+        position = 0 if norm_pos == 0 else offsets[norm_pos - 1] + 1
+        positions.append(max(position, positions[-1] if positions else 0))
+    return positions, similarity
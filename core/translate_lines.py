@@ -1,9 +1,13 @@
+import re
 from core.prompts import generate_shared_prompt, get_prompt_faithfulness, get_prompt_expressiveness
 from rich.panel import Panel
 from rich.console import Console
 from rich.table import Table
 from rich import box
 from core.utils import *
+from core.utils.llm_batch import BatchPending
+from core.utils.llm_stats import STATS
+from core.utils.rate_limiter import estimate_tokens
 
 
 def valid_translate_result(result: dict, required_keys: list, required_sub_keys: list):
@@ -18,25 +22,71 @@ def valid_translate_result(result: dict, required_keys: list, required_sub_keys:
 
     return {"status": "success", "message": "Translation completed"}
 
+def valid_partial_translate_result(partial: dict, length: int, required_sub_key: str):
+    """Check a partially streamed translation: abort on unexpected or extra keys, and on finished items missing the sub-key"""
+    expected = {str(i) for i in range(1, length + 1)}
+    keys = list(partial.keys())
+    unexpected = [key for key in keys if key not in expected]
+    if unexpected:
+        return {"status": "error", "message": f"Unexpected key(s): {', '.join(unexpected)}"}
+    # the last item may still be streaming
+    for key in keys[:-1]:
+        if not isinstance(partial[key], dict) or required_sub_key not in partial[key]:
+            return {"status": "error", "message": f"Missing required sub-key `{required_sub_key}` in item {key}"}
+    return {"status": "success", "message": "", "progress": len(keys) - 1}
+
+# ------------
+# expressiveness gate
+# ------------
+# With `reflect_gate.enabled`, the expressiveness pass only runs on chunks where at least one
+# faithful line looks like it needs it; skipped chunks are counted as `calls_avoided` under
+# translate_expressiveness in the llm report.
+
+def expressiveness_reasons(faith_result):
+    """Why the faithful translation of a chunk should be reworked, empty if it looks fine"""
+    min_ratio, max_ratio = load_key("reflect_gate.length_ratio", [0.4, 2.5])
+    long_line_tokens = load_key("reflect_gate.long_line_tokens", 30)
+    patterns = [re.compile(p, re.IGNORECASE) for p in load_key("reflect_gate.important_patterns", []) or []]
+    reasons = []
+    for key, item in faith_result.items():
+        origin, direct = str(item.get("origin", "")), str(item.get("direct", ""))
+        origin_tokens = estimate_tokens(origin)
+        ratio = estimate_tokens(direct) / max(origin_tokens, 1)
+        if not min_ratio <= ratio <= max_ratio:
+            reasons.append(f"{key}: length ratio {ratio:.2f}")
+        # long source words copied as is usually mean an untranslated or word-for-word line
+        long_words = {w for w in re.findall(r"\w{4,}", origin.lower())}
+        direct_lower = direct.lower()
+        if direct_lower.strip() == origin.lower().strip() or \
+                (len(long_words) >= 2 and sum(w in direct_lower for w in long_words) / len(long_words) >= 0.5):
+            reasons.append(f"{key}: literal")
+        if origin_tokens > long_line_tokens:
+            reasons.append(f"{key}: long line")
+        if any(p.search(origin) for p in patterns):
+            reasons.append(f"{key}: marked important")
+    return reasons
+
 def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_to_note_prompt, summary_prompt, index = 0,GPT_LOG_FOLDER=None,console=None):
     shared_prompt = generate_shared_prompt(previous_content_prompt, after_cotent_prompt, summary_prompt, things_to_note_prompt)
 
-    # Retry translation if the length of the original text and the translated text are not the same, or if the specified key is missing
+    # Retries (with a format nudge) are handled by the shared retry policy in ask_gpt,
+    # so the line count check is part of the validation instead of an extra retry loop here
     def retry_translation(prompt, length, step_name):
-        def valid_faith(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['direct'])
-        def valid_express(response_data):
-            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], ['free'])
-        for retry in range(3):
-            if step_name == 'faithfulness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_faith, log_title=f'translate_{step_name}',GPT_LOG_FOLDER=GPT_LOG_FOLDER)
-            elif step_name == 'expressiveness':
-                result = ask_gpt(prompt+retry* " ", resp_type='json', valid_def=valid_express, log_title=f'translate_{step_name}',GPT_LOG_FOLDER=GPT_LOG_FOLDER)
-            if len(lines.split('\n')) == len(result):
-                return result
-            if retry != 2:
-                console.print(f'[yellow]⚠️ {step_name.capitalize()} translation of block {index} failed, Retry...[/yellow]')
-        raise ValueError(f'[red]❌ {step_name.capitalize()} translation of block {index} failed after 3 retries. Please check `output/gpt_log/error.json` for more details.[/red]')
+        sub_key = 'direct' if step_name == 'faithfulness' else 'free'
+        def valid_result(response_data):
+            if len(response_data) != length:
+                return {"status": "error", "message": f"Expected {length} lines, got {len(response_data)}"}
+            return valid_translate_result(response_data, [str(i) for i in range(1, length+1)], [sub_key])
+        def valid_partial(partial):
+            return valid_partial_translate_result(partial, length, sub_key)
+        try:
+            return ask_gpt(prompt, resp_type='json', valid_def=valid_result, log_title=f'translate_{step_name}',GPT_LOG_FOLDER=GPT_LOG_FOLDER,
+                           stream_valid_def=valid_partial)
+        except BatchPending:
+            raise
+        except Exception:
+            rprint(f'[red]❌ {step_name.capitalize()} translation of block {index} failed. Please check `output/<video>/gpt_log/error.jsonl` for more details.[/red]')
+            raise
 
     ## Step 1: Faithful to the Original Text
     prompt1 = get_prompt_faithfulness(lines, shared_prompt)
@@ -62,6 +112,14 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
         console.print(table)
         return translate_result, lines
 
+    if load_key("reflect_gate.enabled", False):
+        reasons = expressiveness_reasons(faith_result)
+        if not reasons:
+            STATS.record(GPT_LOG_FOLDER, 'translate_expressiveness', calls_avoided=1)
+            console.print(f"[dim]⏭ Block {index}: faithful translation kept, expressiveness pass skipped[/dim]")
+            return "\n".join([faith_result[i]["direct"].strip() for i in faith_result]), lines
+        console.print(f"[dim]🔁 Block {index}: expressiveness pass ({', '.join(reasons[:3])})[/dim]")
+
     ## Step 2: Express Smoothly  
     prompt2 = get_prompt_expressiveness(faith_result, lines, shared_prompt)
     express_result = retry_translation(prompt2, len(lines.split('\n')), 'expressiveness')
@@ -80,7 +138,7 @@ def translate_lines(lines, previous_content_prompt, after_cotent_prompt, things_
     translate_result = "\n".join([express_result[i]["free"].replace('\n', ' ').strip() for i in express_result])
 
     if len(lines.split('\n')) != len(translate_result.split('\n')):
-        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/gpt_log/translate_expressiveness.json`[/red]'))
+        console.print(Panel(f'[red]❌ Translation of block {index} failed, Length Mismatch, Please check `output/<video>/gpt_log/translate_expressiveness.jsonl`[/red]'))
         raise ValueError(f'Origin ···{lines}···,\nbut got ···{translate_result}···')
 
     return translate_result, lines
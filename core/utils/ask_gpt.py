@@ -1,76 +1,120 @@
-import os
-import json
-from threading import Lock
+import time
 import json_repair
-from openai import OpenAI
 from core.utils.config_utils import load_key
 from rich import print as rprint
-from core.utils.decorator import except_handler
+from core.utils.gpt_cache import get_cache, get_global_store
+from core.utils.llm_client import CLIENTS
+from core.utils.llm_router import ROUTER, resolve_routes
+from core.utils.rate_limiter import LIMITERS, estimate_tokens
+from core.utils.retry_policy import RETRY, LLMValidationError, RetryBudgetExceeded
+from core.utils.llm_stats import STATS, video_of
+from core.utils.llm_batch import BATCH, get_prefilled
+from core.utils.translation_memory import get_translation_memory
 
 # ------------
 # cache gpt response
 # ------------
 
-LOCK = Lock()
-# GPT_LOG_FOLDER = 'output/gpt_log'
-
 def _save_cache(model, prompt, resp_content, resp_type, resp, message=None, log_title="default",GPT_LOG_FOLDER=None):
-    with LOCK:
-        logs = []
-        file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-        os.makedirs(os.path.dirname(file), exist_ok=True)
-        if os.path.exists(file):
-            with open(file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        logs.append({"model": model, "prompt": prompt, "resp_content": resp_content, "resp_type": resp_type, "resp": resp, "message": message})
-        with open(file, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=4)
-
-def _load_cache(prompt, resp_type, log_title,GPT_LOG_FOLDER):
-    with LOCK:
-        file = os.path.join(GPT_LOG_FOLDER, f"{log_title}.json")
-        if os.path.exists(file):
-            with open(file, 'r', encoding='utf-8') as f:
-                for item in json.load(f):
-                    if item["prompt"] == prompt and item["resp_type"] == resp_type:
-                        return item["resp"]
-        return False
+    get_cache(GPT_LOG_FOLDER, log_title).append(model, prompt, resp_content, resp_type, resp, message=message)
+    store = get_global_store()
+    if store and log_title != "error":
+        store.put(model, prompt, resp_type, resp, log_title=log_title)
+
+def _load_cache(model, prompt, resp_type, log_title,GPT_LOG_FOLDER):
+    store = get_global_store()
+    if not (store and load_key("gpt_cache.audit_only", False)):
+        cached = get_cache(GPT_LOG_FOLDER, log_title).get(model, prompt, resp_type)
+        if cached:
+            return cached
+    if store:
+        cached = store.get(model, prompt, resp_type)
+        if cached:
+            # keep the per-video log complete for auditing
+            get_cache(GPT_LOG_FOLDER, log_title).append(model, prompt, None, resp_type, cached, message="global store hit")
+        return cached
+    return None
 
 # ------------
-# ask gpt once
+# streaming
 # ------------
 
-@except_handler("GPT request failed", retry=5)
-def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default",GPT_LOG_FOLDER=None):
-    if not load_key("api.key"):
-        raise ValueError("API key is not set")
-    # check cache
-    cached = _load_cache(prompt, resp_type, log_title,GPT_LOG_FOLDER)
-    if cached:
-        rprint("use cache response")
-        return cached
+def _read_stream(stream, stream_valid_def, log_title):
+    """Collect a streamed completion, validating the partial json whenever an object closes"""
+    parts = []
+    start = time.perf_counter()
+    first_result = None
+    progress = 0
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ''
+            parts.append(delta)
+            if stream_valid_def and '}' in delta:
+                # cut at the last closed object so a half-written key like `"1` of `"10"` is never parsed
+                text = ''.join(parts)
+                partial = json_repair.loads(text[:text.rfind('}') + 1])
+                if not isinstance(partial, dict) or not partial:
+                    continue
+                check = stream_valid_def(partial)
+                if check['status'] != 'success':
+                    raise LLMValidationError(f"❎ Stream aborted after {time.perf_counter() - start:.1f}s: {check['message']}")
+                progress = check.get('progress', progress)
+                if first_result is None and progress:
+                    first_result = time.perf_counter() - start
+    finally:
+        stream.close()
+    first_msg = f"first result {first_result:.1f}s, " if first_result is not None else ""
+    rprint(f"[dim]⏱ <{log_title}> streamed: {first_msg}total {time.perf_counter() - start:.1f}s, {progress} items[/dim]")
+    return ''.join(parts)
+
+# ------------
+# ask gpt once
+# ------------
 
-    model = load_key("api.model")
-    base_url = load_key("api.base_url")
-    if 'ark' in base_url:
-        base_url = "https://ark.cn-beijing.volces.com/api/v3" # huoshan base url
-    elif 'v1' not in base_url:
-        base_url = base_url.strip('/') + '/v1'
-    client = OpenAI(api_key=load_key("api.key"), base_url=base_url)
+def _call(endpoint, model, attempt_prompt, resp_type, log_title, GPT_LOG_FOLDER, stream_valid_def=None):
     response_format = {"type": "json_object"} if resp_type == "json" and load_key("api.llm_support_json") else None
 
-    messages = [{"role": "user", "content": prompt}]
+    messages = [{"role": "user", "content": attempt_prompt}]
 
     params = dict(
         model=model,
         messages=messages,
         response_format=response_format,
-        timeout=300
+        timeout=load_key("api.timeout", 300)
     )
-    resp_raw = client.chat.completions.create(**params)
+    stream = load_key("api.stream", False)
+    if stream:
+        params["stream"] = True
+    start = time.perf_counter()
+    try:
+        resp_raw = LIMITERS.call(endpoint.name, attempt_prompt, lambda: CLIENTS.chat(endpoint.base_url, endpoint.api_key, **params),
+                                 rpm=endpoint.rpm, tpm=endpoint.tpm)
 
-    # process and return full result
-    resp_content = resp_raw.choices[0].message.content
+        # process and return full result
+        if stream:
+            resp_content = _read_stream(resp_raw, stream_valid_def if resp_type == "json" else None, log_title)
+        else:
+            resp_content = resp_raw.choices[0].message.content
+    except LLMValidationError:
+        STATS.record(GPT_LOG_FOLDER, log_title, requests=1, validation_failures=1, latency=time.perf_counter() - start)
+        raise
+    except Exception:
+        STATS.record(GPT_LOG_FOLDER, log_title, requests=1, errors=1, latency=time.perf_counter() - start)
+        raise
+    usage = None if stream else getattr(resp_raw, 'usage', None)
+    STATS.record(GPT_LOG_FOLDER, log_title, requests=1, latency=time.perf_counter() - start,
+                 prompt_tokens=getattr(usage, 'prompt_tokens', None) or estimate_tokens(attempt_prompt),
+                 completion_tokens=getattr(usage, 'completion_tokens', None) or estimate_tokens(resp_content or ''))
+    return resp_content
+
+def _request(endpoint, model, prompt, attempt_prompt, resp_type, valid_def, log_title, GPT_LOG_FOLDER, stream_valid_def=None, prefilled=None):
+    if prefilled is not None:
+        # already answered by the batch api, only validation is left
+        resp_content = prefilled
+    else:
+        resp_content = _call(endpoint, model, attempt_prompt, resp_type, log_title, GPT_LOG_FOLDER, stream_valid_def)
     if resp_type == "json":
         resp = json_repair.loads(resp_content)
     else:
@@ -78,14 +122,77 @@ def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default",GPT_LOG_
     
     # check if the response format is valid
     if valid_def:
-        valid_resp = valid_def(resp)
+        try:
+            valid_resp = valid_def(resp)
+        except Exception as e:
+            valid_resp = {"status": "error", "message": f"{type(e).__name__}: {e}"}
         if valid_resp['status'] != 'success':
-            _save_cache(model, prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'])
-            raise ValueError(f"❎ API response error: {valid_resp['message']}")
+            STATS.record(GPT_LOG_FOLDER, log_title, validation_failures=1)
+            _save_cache(model, attempt_prompt, resp_content, resp_type, resp, log_title="error", message=valid_resp['message'],GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+            raise LLMValidationError(f"❎ API response error: {valid_resp['message']}")
 
+    # cache under the original prompt so a nudged retry is still hit on the next run
     _save_cache(model, prompt, resp_content, resp_type, resp, log_title=log_title,GPT_LOG_FOLDER=GPT_LOG_FOLDER)
     return resp
 
+def ask_gpt(prompt, resp_type=None, valid_def=None, log_title="default",GPT_LOG_FOLDER=None, stream_valid_def=None):
+    """`stream_valid_def(partial_resp)` is only used with `api.stream` and may abort a json response early;
+    it returns the same status dict as `valid_def`, optionally with a `progress` count."""
+    if not load_key("api.key") and not load_key("api.endpoints", None):
+        raise ValueError("API key is not set")
+    routes = resolve_routes(log_title)
+    # check cache
+    for route in routes:
+        cached = _load_cache(route.model, prompt, resp_type, log_title,GPT_LOG_FOLDER)
+        if cached:
+            rprint("use cache response")
+            STATS.record(GPT_LOG_FOLDER, log_title, calls=1, cache_hits=1)
+            return cached
+    # batch api mode: use the prefetched answer, or record the prompt for the next batch
+    prefilled = [get_prefilled(GPT_LOG_FOLDER, routes[0].model, prompt, resp_type)]
+    if prefilled[0] is None:
+        BATCH.collect(GPT_LOG_FOLDER, routes[0].model, prompt, resp_type, log_title)
+
+    attempts = [0]
+    start = time.perf_counter()
+    try:
+        for i, route in enumerate(routes):
+            def attempt(attempt_prompt, endpoint, model=route.model):
+                attempts[0] += 1
+                # the prefetched answer is only used once, retries go to the live api
+                prefilled_resp, prefilled[0] = prefilled[0], None
+                return _request(endpoint, model, prompt, attempt_prompt, resp_type, valid_def, log_title, GPT_LOG_FOLDER,
+                                stream_valid_def, prefilled=prefilled_resp)
+            try:
+                return RETRY.run(attempt, prompt, route.router, video_key=GPT_LOG_FOLDER, label=f"GPT request <{log_title}> [{route.model}]")
+            except RetryBudgetExceeded:
+                raise
+            except Exception as e:
+                if i == len(routes) - 1:
+                    raise
+                rprint(f"[yellow]⚠️ <{log_title}> gave up on {route.model} ({e}), falling back to {routes[i + 1].model}[/yellow]")
+    finally:
+        STATS.record(GPT_LOG_FOLDER, log_title, calls=1, retries=max(attempts[0] - 1, 0), wall_time=time.perf_counter() - start)
+
+# ------------
+# run report
+# ------------
+
+def write_llm_report(path, GPT_LOG_FOLDER=None):
+    """Write tokens/latency/cost/cache stats per log_title (for one video if GPT_LOG_FOLDER is given).
+    The pooled clients, routing, rate limits and stores are shared by every video, so their sections
+    only go into the process-wide report (without GPT_LOG_FOLDER)."""
+    if GPT_LOG_FOLDER:
+        return STATS.write_report(path, video_of(GPT_LOG_FOLDER))
+    store = get_global_store()
+    extra = {"endpoints": CLIENTS.report(), "routing": ROUTER.report(), "rate_limits": LIMITERS.report()}
+    if store:
+        extra["global_store"] = store.stats()
+    memory = get_translation_memory()
+    if memory:
+        extra["translation_memory"] = memory.stats()
+    return STATS.write_report(path, extra=extra)
+
 
 if __name__ == '__main__':
     from rich import print as rprint
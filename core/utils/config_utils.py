@@ -1,8 +1,11 @@
+import os
+import copy
 from ruamel.yaml import YAML
 import threading
 
 CONFIG_PATH = 'config.yaml'
 lock = threading.Lock()
+_MISSING = object()
 
 yaml = YAML()
 yaml.preserve_quotes = True
@@ -11,10 +14,22 @@ yaml.preserve_quotes = True
 # load & update config
 # -----------------------
 
-def load_key(key):
-    with lock:
+# the parsed config is kept until config.yaml changes on disk (or through update_key),
+# so the many load_key calls of one llm request do not each parse the file again
+_cache = {}
+
+def _load_config():
+    stat = os.stat(CONFIG_PATH)
+    version = (os.path.abspath(CONFIG_PATH), stat.st_mtime_ns, stat.st_size)
+    if _cache.get('version') != version:
         with open(CONFIG_PATH, 'r', encoding='utf-8') as file:
-            data = yaml.load(file)
+            _cache['data'] = yaml.load(file)
+        _cache['version'] = version
+    return _cache['data']
+
+def load_key(key, default=_MISSING):
+    with lock:
+        data = _load_config()
 
     keys = key.split('.')
     value = data
@@ -22,8 +37,11 @@ def load_key(key):
         if isinstance(value, dict) and k in value:
             value = value[k]
         else:
+            if default is not _MISSING:
+                return default
             raise KeyError(f"Key '{k}' not found in configuration")
-    return value
+    # callers may modify what they get, never the cached config
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
 
 def update_key(key, new_value):
     with lock:
@@ -42,6 +60,7 @@ def update_key(key, new_value):
             current[keys[-1]] = new_value
             with open(CONFIG_PATH, 'w', encoding='utf-8') as file:
                 yaml.dump(data, file)
+            _cache.clear()
             return True
         else:
             raise KeyError(f"Key '{keys[-1]}' not found in configuration")
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+from threading import Lock
+from core.utils.config_utils import load_key
+
+# ------------
+# append-only gpt response cache
+# ------------
+# Every log_title gets its own `{log_title}.jsonl` file: one json entry per line,
+# new entries are appended and never rewrite the file. An in-memory hash index
+# (model, prompt, resp_type) -> resp is built once per file, so lookups are O(1).
+# The index is rebuilt when the file is no longer the one it was built from (moved away by
+# cleanup, deleted to force a re-ask, or written by another process).
+
+DEFAULT_GPT_LOG_FOLDER = 'output/gpt_log'
+
+def cache_key(model, prompt, resp_type):
+    raw = json.dumps([model, prompt, resp_type], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class GPTCache:
+    def __init__(self, file):
+        self.file = file
+        self.lock = Lock()
+        self._index = None
+        self._signature = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def _load_index(self):
+        index = {}
+        if os.path.exists(self.file):
+            with open(self.file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # skip a half-written tail line after a crash
+                    key = item.get("key") or cache_key(item.get("model"), item["prompt"], item.get("resp_type"))
+                    index[key] = item["resp"]
+        return index
+
+    def _ensure_index(self):
+        signature = self._file_signature()
+        if self._index is None or signature != self._signature:
+            self._index = self._load_index()
+            self._signature = signature
+        return self._index
+
+    def get(self, model, prompt, resp_type):
+        with self.lock:
+            return self._ensure_index().get(cache_key(model, prompt, resp_type))
+
+    def append(self, model, prompt, resp_content, resp_type, resp, message=None):
+        key = cache_key(model, prompt, resp_type)
+        entry = {"key": key, "model": model, "prompt": prompt, "resp_content": resp_content,
+                 "resp_type": resp_type, "resp": resp, "message": message}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            index = self._ensure_index()
+            os.makedirs(os.path.dirname(self.file) or '.', exist_ok=True)
+            with open(self.file, 'a', encoding='utf-8') as f:
+                f.write(line)
+            index[key] = resp
+            self._signature = self._file_signature()
+
+    def __len__(self):
+        with self.lock:
+            return len(self._ensure_index())
+
+_CACHES = {}
+_CACHES_LOCK = Lock()
+
+def get_cache(GPT_LOG_FOLDER, log_title):
+    """Return the shared cache object for `{GPT_LOG_FOLDER}/{log_title}.jsonl`"""
+    folder = GPT_LOG_FOLDER or DEFAULT_GPT_LOG_FOLDER
+    file = os.path.abspath(os.path.join(folder, f"{log_title}.jsonl"))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(file)
+        if cache is None:
+            import_legacy_log(os.path.join(folder, f"{log_title}.json"), file)
+            cache = _CACHES[file] = GPTCache(file)
+        return cache
+
+# ------------
+# cross-video content-addressed store
+# ------------
+# Optional sqlite store shared by every video (every PathManager), keyed by the same
+# cache_key as the per-video logs and bounded by an LRU on `last_used`.
+# Enable with `gpt_cache.global_store: true`; with `gpt_cache.audit_only: true` the
+# per-video logs are still written but only the global store is used for lookups.
+
+class GlobalStore:
+    # `last_used` updates of hits are buffered and written every TOUCH_BATCH hits (and before an
+    # eviction or on close), and the row count is kept in memory, so a hit costs one indexed read
+    # and an insert never counts the table
+    TOUCH_BATCH = 64
+
+    def __init__(self, path, max_entries=100000):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, log_title TEXT, resp TEXT, last_used REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self.conn.commit()
+        self.count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _flush_touches(self):
+        if self._touched:
+            self.conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                  [(used, key) for key, used in self._touched.items()])
+            self.conn.commit()
+            self._touched.clear()
+
+    def get(self, model, prompt, resp_type):
+        key = cache_key(model, prompt, resp_type)
+        with self.lock:
+            row = self.conn.execute("SELECT resp FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touches()
+        return json.loads(row[0])
+
+    def put(self, model, prompt, resp_type, resp, log_title=None):
+        key = cache_key(model, prompt, resp_type)
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                              (key, log_title, json.dumps(resp, ensure_ascii=False), time.time()))
+            self._touched.pop(key, None)
+            if not exists:
+                self.count += 1
+            if self.count > self.max_entries:
+                # evict a tenth more than needed so the next inserts do not evict one by one
+                self._flush_touches()
+                overflow = self.count - self.max_entries + self.max_entries // 10
+                self.conn.execute("""DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used LIMIT ?)""", (overflow,))
+                self.evictions += overflow
+                # other processes may share the store, take the real count after an eviction
+                self.count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": self.count, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def close(self):
+        with self.lock:
+            self._flush_touches()
+            self.conn.close()
+
+_GLOBAL_STORE = None
+
+def get_global_store():
+    """Return the shared GlobalStore, or None when `gpt_cache.global_store` is disabled"""
+    global _GLOBAL_STORE
+    if not load_key("gpt_cache.global_store", False):
+        return None
+    with _CACHES_LOCK:
+        if _GLOBAL_STORE is None:
+            _GLOBAL_STORE = GlobalStore(load_key("gpt_cache.store_path", "cache/gpt_store.db"),
+                                        max_entries=load_key("gpt_cache.max_entries", 100000))
+            # write the buffered `last_used` updates when the process ends
+            atexit.register(_GLOBAL_STORE.close)
+        return _GLOBAL_STORE
+
+# ------------
+# import old `gpt_log/*.json` files
+# ------------
+
+def import_legacy_log(legacy_file, jsonl_file=None):
+    """Convert a legacy json array log into jsonl, return the number of imported entries"""
+    jsonl_file = jsonl_file or os.path.splitext(legacy_file)[0] + '.jsonl'
+    if not os.path.exists(legacy_file) or os.path.exists(jsonl_file):
+        return 0
+    with open(legacy_file, 'r', encoding='utf-8') as f:
+        logs = json.load(f)
+    tmp_file = jsonl_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for item in logs:
+            item["key"] = cache_key(item.get("model"), item["prompt"], item.get("resp_type"))
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+    os.replace(tmp_file, jsonl_file)
+    return len(logs)
+
+def import_legacy_folder(GPT_LOG_FOLDER):
+    """Import every `*.json` log under a gpt_log folder, return {log_title: count}"""
+    imported = {}
+    if not os.path.isdir(GPT_LOG_FOLDER):
+        return imported
+    for name in sorted(os.listdir(GPT_LOG_FOLDER)):
+        if name.endswith('.json'):
+            imported[name[:-5]] = import_legacy_log(os.path.join(GPT_LOG_FOLDER, name))
+    return imported
+
+if __name__ == '__main__':
+    import sys
+    from rich import print as rprint
+    for folder in sys.argv[1:] or [DEFAULT_GPT_LOG_FOLDER]:
+        rprint(f"{folder}: {import_legacy_folder(folder)}")
@@ -0,0 +1,158 @@
+import io
+import os
+import json
+import time
+from threading import Lock
+from contextlib import contextmanager
+from rich import print as rprint
+from core.utils.config_utils import load_key
+from core.utils.gpt_cache import cache_key, get_cache
+from core.utils.llm_client import CLIENTS
+from core.utils.llm_router import resolve_routes
+from core.utils.llm_stats import STATS
+
+# ------------
+# offline batch-api mode
+# ------------
+# The stage runs once in "collect" mode: every ask_gpt call that has neither a cached nor a
+# prefetched result records its request and raises BatchPending. The collected requests are
+# submitted as one OpenAI-compatible batch per endpoint, polled until done and stored as
+# prefetched results (`gpt_log/batch_prefill.jsonl`). The next collect round gets further
+# (e.g. faithfulness answers unlock the expressiveness prompts). Finally the stage runs
+# normally: prefetched results go through the usual validation and caching in ask_gpt,
+# and anything invalid or missing is requested live. Pending batch ids are saved in a
+# state file so a restarted run resumes polling instead of submitting again.
+
+BATCH_PREFILL_TITLE = "batch_prefill"
+
+class BatchPending(Exception):
+    """Raised in collect mode for a prompt whose result is not available yet"""
+
+class BatchCollector:
+    def __init__(self):
+        self.lock = Lock()
+        self._active = {}
+
+    @contextmanager
+    def collecting(self, GPT_LOG_FOLDER):
+        requests = {}
+        with self.lock:
+            self._active[GPT_LOG_FOLDER] = requests
+        try:
+            yield requests
+        finally:
+            with self.lock:
+                self._active.pop(GPT_LOG_FOLDER, None)
+
+    def collect(self, GPT_LOG_FOLDER, model, prompt, resp_type, log_title):
+        """Record the request and raise BatchPending if GPT_LOG_FOLDER is being collected"""
+        with self.lock:
+            requests = self._active.get(GPT_LOG_FOLDER)
+            if requests is None:
+                return
+            requests[cache_key(model, prompt, resp_type)] = {
+                "model": model, "prompt": prompt, "resp_type": resp_type, "log_title": log_title}
+        raise BatchPending(log_title)
+
+BATCH = BatchCollector()
+
+def get_prefilled(GPT_LOG_FOLDER, model, prompt, resp_type):
+    return get_cache(GPT_LOG_FOLDER, BATCH_PREFILL_TITLE).get(model, prompt, resp_type)
+
+# ------------
+# submit / poll / ingest
+# ------------
+
+def _batch_line(key, request):
+    body = {"model": request["model"], "messages": [{"role": "user", "content": request["prompt"]}]}
+    if request["resp_type"] == "json" and load_key("api.llm_support_json"):
+        body["response_format"] = {"type": "json_object"}
+    return json.dumps({"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": body}, ensure_ascii=False)
+
+def submit_batch(endpoint, requests):
+    client, _ = CLIENTS.get(endpoint.base_url, endpoint.api_key)
+    payload = '\n'.join(_batch_line(key, request) for key, request in requests.items()).encode('utf-8')
+    batch_file = client.files.create(file=("batch_requests.jsonl", io.BytesIO(payload)), purpose="batch")
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions",
+                                  completion_window=load_key("batch_api.completion_window", "24h"))
+    rprint(f"[cyan]📤 Submitted batch {batch.id} with {len(requests)} requests to {endpoint.base_url}[/cyan]")
+    return batch.id
+
+def wait_batch(endpoint, batch_id):
+    """Poll until the batch ends, return {custom_id: response body} of the successful requests"""
+    client, _ = CLIENTS.get(endpoint.base_url, endpoint.api_key)
+    deadline = time.time() + load_key("batch_api.max_wait", 24 * 3600)
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            break
+        if time.time() > deadline:
+            raise TimeoutError(f"Batch {batch_id} still `{batch.status}` after batch_api.max_wait")
+        rprint(f"[dim]⏳ Batch {batch_id}: {batch.status}[/dim]")
+        time.sleep(load_key("batch_api.poll_interval", 30))
+    results = {}
+    # expired/cancelled batches still return the part that finished
+    if getattr(batch, 'output_file_id', None):
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                results[item["custom_id"]] = response["body"]
+    rprint(f"[cyan]📥 Batch {batch_id} {batch.status}: {len(results)} results[/cyan]")
+    return results
+
+def ingest_results(GPT_LOG_FOLDER, requests, results):
+    cache = get_cache(GPT_LOG_FOLDER, BATCH_PREFILL_TITLE)
+    for key, body in results.items():
+        request = requests.get(key)
+        if request is None:
+            continue  # the prompt changed since the batch was submitted
+        content = body["choices"][0]["message"]["content"]
+        cache.append(request["model"], request["prompt"], content, request["resp_type"], content)
+        usage = body.get("usage") or {}
+        STATS.record(GPT_LOG_FOLDER, request["log_title"], requests=1,
+                     prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+
+# ------------
+# rounds
+# ------------
+
+def _load_state(STATE_FILE):
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"pending": {}, "done": []}
+
+def _save_state(STATE_FILE, state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+
+def run_batched(collect_fn, GPT_LOG_FOLDER, STATE_FILE):
+    """Prefetch every prompt `collect_fn` needs through the batch api, round by round"""
+    for round_index in range(load_key("batch_api.max_rounds", 4)):
+        with BATCH.collecting(GPT_LOG_FOLDER) as requests:
+            collect_fn()
+        if not requests:
+            return
+        rprint(f"[cyan]📦 Batch round {round_index + 1}: {len(requests)} prompts to prefetch[/cyan]")
+
+        # group by the endpoint of each request's primary route
+        groups = {}
+        for key, request in requests.items():
+            endpoint = resolve_routes(request["log_title"])[0].router.endpoints()[0]
+            groups.setdefault(endpoint.name, (endpoint, {}))[1][key] = request
+
+        state = _load_state(STATE_FILE)
+        for name, (endpoint, group) in groups.items():
+            if name not in state["pending"]:
+                state["pending"][name] = submit_batch(endpoint, group)
+                _save_state(STATE_FILE, state)
+        for name, (endpoint, group) in groups.items():
+            batch_id = state["pending"][name]
+            ingest_results(GPT_LOG_FOLDER, requests, wait_batch(endpoint, batch_id))
+            state["pending"].pop(name)
+            state["done"].append(batch_id)
+            _save_state(STATE_FILE, state)
@@ -0,0 +1,118 @@
+import time
+import httpx
+from threading import Lock
+from openai import OpenAI
+from core.utils.config_utils import load_key
+
+# ------------
+# pooled openai clients
+# ------------
+# One OpenAI client (and one keep-alive httpx connection pool) per (base_url, api_key),
+# shared by every thread and every video, so TLS/HTTP connections are reused.
+
+def normalize_base_url(base_url):
+    if 'ark' in base_url:
+        return "https://ark.cn-beijing.volces.com/api/v3" # huoshan base url
+    elif 'v1' not in base_url:
+        return base_url.strip('/') + '/v1'
+    return base_url
+
+class ClientStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.http_requests = 0
+        self.connections = 0
+
+    def on_request(self, request):
+        """httpx request hook: count the request, and through httpcore's trace the connections it opens"""
+        with self.lock:
+            self.http_requests += 1
+        def trace(event_name, info):
+            if event_name.startswith("connection.connect_") and event_name.endswith(".complete"):
+                with self.lock:
+                    self.connections += 1
+        request.extensions["trace"] = trace
+
+    def record(self, latency, ok=True):
+        with self.lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                # http requests (including the client's own retries) sent on a kept-alive connection
+                "connections": self.connections,
+                "reused": max(self.http_requests - self.connections, 0),
+                "total_latency": self.total_latency,
+                "max_latency": self.max_latency,
+            }
+
+class ClientRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        self._clients = {}
+        self._stats = {}
+
+    def get(self, base_url, api_key):
+        key = (normalize_base_url(base_url), api_key)
+        with self.lock:
+            client = self._clients.get(key)
+            if client is None:
+                pool_size = load_key("api.pool_size", 32)
+                stats = ClientStats()
+                http_client = httpx.Client(
+                    event_hooks={"request": [stats.on_request]},
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                        keepalive_expiry=load_key("api.keepalive_expiry", 60)),
+                    timeout=httpx.Timeout(load_key("api.timeout", 300), connect=load_key("api.connect_timeout", 10)),
+                )
+                client = self._clients[key] = OpenAI(api_key=api_key, base_url=key[0], http_client=http_client,
+                                                            max_retries=0)  # RetryPolicy is the only retry layer
+                self._stats[key] = stats
+            return client, self._stats[key]
+
+    def chat(self, base_url, api_key, **params):
+        """Run one chat completion on the pooled client and record its latency"""
+        client, stats = self.get(base_url, api_key)
+        start = time.perf_counter()
+        try:
+            resp = client.chat.completions.create(**params)
+        except Exception:
+            stats.record(time.perf_counter() - start, ok=False)
+            raise
+        stats.record(time.perf_counter() - start)
+        return resp
+
+    def report(self):
+        """Return {base_url: stats} for every pooled endpoint (api keys are not exposed)"""
+        with self.lock:
+            items = list(self._stats.items())
+        report = {}
+        for (base_url, _), stats in items:
+            merged = report.setdefault(base_url, {"clients": 0, "requests": 0, "errors": 0, "connections": 0, "reused": 0,
+                                                  "total_latency": 0.0, "max_latency": 0.0})
+            merged["clients"] += 1
+            for k, v in stats.to_dict().items():
+                merged[k] = max(merged[k], v) if k == "max_latency" else merged[k] + v
+        for merged in report.values():
+            merged["avg_latency"] = merged["total_latency"] / merged["requests"] if merged["requests"] else 0.0
+        return report
+
+    def close(self):
+        with self.lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._stats.clear()
+
+CLIENTS = ClientRegistry()
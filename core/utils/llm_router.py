@@ -0,0 +1,167 @@
+import time
+import hashlib
+import threading
+from threading import Lock
+from rich import print as rprint
+from core.utils.config_utils import load_key
+from core.utils.llm_client import CLIENTS, normalize_base_url
+
+# ------------
+# multi-endpoint routing
+# ------------
+# `api.endpoints` is an optional list of OpenAI-compatible endpoints:
+#   - {base_url: ..., key: ..., weight: 2, rpm: 500, tpm: 200000}
+# Without it the single `api.base_url` / `api.key` pair is used. Requests go to the healthy
+# endpoint with the fewest outstanding requests per unit of weight, and a failing endpoint
+# is skipped on retry. The cache key never contains the endpoint, so any endpoint can serve a hit.
+
+class Endpoint:
+    def __init__(self, base_url, api_key, weight=1, rpm=None, tpm=None):
+        self.base_url = normalize_base_url(base_url)
+        self.api_key = api_key
+        self.weight = max(float(weight), 0.01)
+        self.rpm = rpm
+        self.tpm = tpm
+        # the key is part of the name (hashed) because limits are per key, not per url
+        self.name = f"{self.base_url}#{hashlib.sha1(str(api_key).encode('utf-8')).hexdigest()[:8]}"
+        self.outstanding = 0
+        self.served = 0
+        self.healthy = True
+        self.last_check = None
+
+    def to_dict(self):
+        return {"base_url": self.base_url, "weight": self.weight, "outstanding": self.outstanding,
+                "served": self.served, "healthy": self.healthy, "last_check": self.last_check}
+
+def _parse_specs(specs):
+    return [(spec["base_url"], spec["key"], spec.get("weight", 1), spec.get("rpm"), spec.get("tpm")) for spec in specs]
+
+def _endpoint_specs():
+    specs = load_key("api.endpoints", None)
+    if not specs:
+        specs = [{"base_url": load_key("api.base_url"), "key": load_key("api.key")}]
+    return _parse_specs(specs)
+
+class EndpointRouter:
+    def __init__(self, specs_fn=_endpoint_specs):
+        self.specs_fn = specs_fn
+        self.lock = Lock()
+        self._specs = None
+        self._endpoints = []
+        self._health_thread = None
+
+    def endpoints(self):
+        """Sync the endpoint list with the config, keeping the counters of unchanged endpoints"""
+        specs = self.specs_fn()
+        with self.lock:
+            if specs != self._specs:
+                old = {e.name: e for e in self._endpoints}
+                fresh = [Endpoint(*spec) for spec in specs]
+                self._endpoints = [old.get(e.name, e) for e in fresh]
+                self._specs = specs
+            endpoints = list(self._endpoints)
+        self._start_health_checks()
+        return endpoints
+
+    def _candidates(self, exclude, is_open):
+        endpoints = self.endpoints()
+        usable = [e for e in endpoints if e.healthy and not is_open(e.name)] or endpoints
+        return [e for e in usable if e.name not in exclude] or usable
+
+    def has_alternative(self, exclude, is_open):
+        return any(e.name not in exclude for e in self._candidates(exclude, is_open))
+
+    def acquire(self, exclude=(), is_open=lambda name: False):
+        """Pick the least loaded usable endpoint, skipping the ones in `exclude` when possible"""
+        candidates = self._candidates(exclude, is_open)
+        with self.lock:
+            endpoint = min(candidates, key=lambda e: (e.outstanding + 1) / e.weight)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint):
+        with self.lock:
+            endpoint.outstanding -= 1
+            endpoint.served += 1
+
+    # ------------
+    # active health checks
+    # ------------
+
+    def health_check(self, timeout=5):
+        """List models on every endpoint, mark the ones that do not answer as unhealthy"""
+        for endpoint in self.endpoints():
+            client, _ = CLIENTS.get(endpoint.base_url, endpoint.api_key)
+            try:
+                client.models.list(timeout=timeout)
+                healthy = True
+            except Exception as e:
+                healthy = False
+                rprint(f"[yellow]⚠️ Endpoint {endpoint.base_url} failed health check: {e}[/yellow]")
+            with self.lock:
+                endpoint.healthy = healthy
+                endpoint.last_check = time.time()
+
+    def _start_health_checks(self):
+        if self._health_thread is not None:
+            return
+        interval = load_key("api.health_check_interval", 0)
+        if not interval:
+            return
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.health_check()
+        with self.lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=loop, daemon=True, name="llm-health-check")
+                self._health_thread.start()
+
+    def report(self):
+        with self.lock:
+            return {e.name: e.to_dict() for e in self._endpoints}
+
+ROUTER = EndpointRouter()
+
+# ------------
+# per-stage model routing
+# ------------
+# `api.routes` maps a log_title to its own model and, optionally, its own endpoints:
+#   split_by_meaning: {model: small-fast-model, fallback: strong-model}
+#   translate_expressiveness: {model: strong-model, base_url: ..., key: ...}
+# `fallback` is a model name or a route dict; it is tried once the primary route has given up.
+# Titles without a route use `api.model` on the default endpoints.
+
+class Route:
+    def __init__(self, model, router):
+        self.model = model
+        self.router = router
+
+_ROUTE_ROUTERS = {}
+_ROUTE_ROUTERS_LOCK = Lock()
+
+def _router_for(cfg):
+    if cfg.get("endpoints"):
+        specs = _parse_specs(cfg["endpoints"])
+    elif cfg.get("base_url"):
+        specs = _parse_specs([{"base_url": cfg["base_url"], "key": cfg.get("key") or load_key("api.key"), "weight": 1,
+                               "rpm": cfg.get("rpm"), "tpm": cfg.get("tpm")}])
+    else:
+        return ROUTER
+    key = tuple(specs)
+    with _ROUTE_ROUTERS_LOCK:
+        router = _ROUTE_ROUTERS.get(key)
+        if router is None:
+            router = _ROUTE_ROUTERS[key] = EndpointRouter(lambda specs=specs: specs)
+        return router
+
+def resolve_routes(log_title):
+    """Return the routes to try for a log_title: the primary route, then its fallback if any"""
+    routes_cfg = load_key("api.routes", None) or {}
+    cfg = dict(routes_cfg.get(log_title) or {})
+    routes = [Route(cfg.get("model") or load_key("api.model"), _router_for(cfg))]
+    fallback = cfg.get("fallback")
+    if fallback:
+        fallback = {"model": fallback} if isinstance(fallback, str) else dict(fallback)
+        routes.append(Route(fallback.get("model") or load_key("api.model"), _router_for(fallback)))
+    return routes
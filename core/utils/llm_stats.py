@@ -0,0 +1,90 @@
+import os
+import json
+import time
+from threading import Lock
+from core.utils.config_utils import load_key
+
+# ------------
+# llm call telemetry
+# ------------
+# Counters are aggregated per (video, log_title). The video is identified by its
+# GPT_LOG_FOLDER, which is unique per PathManager.
+
+# `calls_avoided` counts the items a stage settled locally instead of asking the llm
+COUNTERS = ("calls", "cache_hits", "requests", "retries", "validation_failures", "errors",
+            "prompt_tokens", "completion_tokens", "latency", "wall_time", "calls_avoided")
+
+def video_of(GPT_LOG_FOLDER):
+    folder = os.path.normpath(GPT_LOG_FOLDER or 'output/gpt_log')
+    return os.path.basename(os.path.dirname(folder)) or 'output'
+
+class LLMStats:
+    def __init__(self):
+        self.lock = Lock()
+        self._stats = {}
+        self.started = time.time()
+        self._video_started = {}
+
+    def reset_video(self, video):
+        """Drop the counters of `video`, e.g. before a batch run reuses its output folder for the next video"""
+        with self.lock:
+            for key in [k for k in self._stats if k[0] == video]:
+                del self._stats[key]
+            self._video_started[video] = time.time()
+
+    def record(self, GPT_LOG_FOLDER, log_title, **counters):
+        key = (video_of(GPT_LOG_FOLDER), log_title)
+        with self.lock:
+            entry = self._stats.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            entry["max_latency"] = max(entry.get("max_latency", 0.0), counters.get("latency", 0.0))
+            for name, value in counters.items():
+                entry[name] += value
+
+    def counters(self, GPT_LOG_FOLDER, log_title):
+        """Copy of the raw counters of one stage, subtract two copies to get the figures of a single run"""
+        with self.lock:
+            return dict(self._stats.get((video_of(GPT_LOG_FOLDER), log_title)) or dict.fromkeys(COUNTERS, 0))
+
+    def _summarize(self, entry):
+        summary = dict(entry)
+        price = load_key("api.price", {}) or {}  # USD per 1M tokens
+        summary["cost"] = (entry["prompt_tokens"] * price.get("prompt", 0) +
+                           entry["completion_tokens"] * price.get("completion", 0)) / 1e6
+        summary["cache_hit_rate"] = entry["cache_hits"] / entry["calls"] if entry["calls"] else 0.0
+        summary["avg_latency"] = entry["latency"] / entry["requests"] if entry["requests"] else 0.0
+        handled = entry["calls"] + entry["calls_avoided"]
+        summary["avoided_rate"] = entry["calls_avoided"] / handled if handled else 0.0
+        return summary
+
+    def report(self, video=None):
+        """Return {video: {log_title: counters}} (only one video if given), including cost and rates"""
+        with self.lock:
+            items = [(k, dict(v)) for k, v in self._stats.items()]
+        report = {}
+        for (video_name, log_title), entry in items:
+            if video is None or video_name == video:
+                report.setdefault(video_name, {})[log_title] = self._summarize(entry)
+        return report
+
+    def totals(self, video=None):
+        total = dict.fromkeys(COUNTERS, 0)
+        total["max_latency"] = 0.0
+        for titles in self.report(video).values():
+            for entry in titles.values():
+                for name in COUNTERS:
+                    total[name] += entry[name]
+                total["max_latency"] = max(total["max_latency"], entry["max_latency"])
+        return self._summarize(total)
+
+    def write_report(self, path, video=None, extra=None):
+        """Write a json run report, `extra` adds sections such as pooled client or rate limiter stats"""
+        started = self._video_started.get(video, self.started) if video else self.started
+        report = {"started": started, "finished": time.time(),
+                  "totals": self.totals(video), "by_title": self.report(video)}
+        report.update(extra or {})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        return report
+
+STATS = LLMStats()
@@ -33,12 +33,24 @@ def _3_2_SPLIT_BY_MEANING(path_manager: PathManager):
 def _GPT_LOG_FOLDER(path_manager: PathManager):
     return f"{path_manager.get_video_path()}/gpt_log"
 
+def _LLM_REPORT(path_manager: PathManager):
+    return f"{path_manager.get_video_path()}/log/llm_report.json"
+
 def _4_1_TERMINOLOGY(path_manager: PathManager):
     return f"{path_manager.get_video_path()}/log/terminology.json"
 
 def _4_2_TRANSLATION(path_manager: PathManager):
     return f"{path_manager.get_video_path()}/log/translation_results.xlsx"
 
+def _4_2_CHUNK_STATE(path_manager: PathManager):
+    return f"{path_manager.get_video_path()}/log/translate_chunk_state.json"
+
+def _4_2_BATCH_STATE(path_manager: PathManager):
+    return f"{path_manager.get_video_path()}/log/translate_batch_state.json"
+
+def _4_2_FINGERPRINTS(path_manager: PathManager):
+    return f"{path_manager.get_video_path()}/log/translate_fingerprints.json"
+
 def _5_SPLIT_SUB(path_manager: PathManager):
     return f"{path_manager.get_video_path()}/log/translation_results_for_subtitles.xlsx"
 
@@ -95,6 +107,9 @@ __all__ = [
     "_3_2_SPLIT_BY_MEANING",
     "_4_1_TERMINOLOGY",
     "_4_2_TRANSLATION",
+    "_4_2_CHUNK_STATE",
+    "_4_2_BATCH_STATE",
+    "_4_2_FINGERPRINTS",
     "_5_SPLIT_SUB",
     "_5_REMERGED",
     "_8_1_AUDIO_TASK",
@@ -110,5 +125,6 @@ __all__ = [
     "_SPLIT_BY_COMMA_FILE",
     "_SPLIT_BY_CONNECTOR_FILE",
     "_SPLIT_BY_MARK_FILE",
-    "_GPT_LOG_FOLDER"
+    "_GPT_LOG_FOLDER",
+    "_LLM_REPORT"
 ]
\ No newline at end of file
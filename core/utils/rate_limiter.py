@@ -0,0 +1,165 @@
+import re
+import time
+from threading import Condition, Lock
+from core.utils.config_utils import load_key
+
+# ------------
+# process-wide llm rate limiter
+# ------------
+# Every endpoint gets a requests-per-minute and a tokens-per-minute token bucket.
+# Callers from all videos/threads queue in FIFO order, so no video can starve the others,
+# and a 429 with `Retry-After` pauses the whole endpoint instead of only the failing thread.
+
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_NON_LATIN_PATTERN = re.compile(r'[\u0370-\u03ff\u0400-\u04ff\u0590-\u06ff\u0e00-\u0e7f]')
+
+def estimate_tokens(text):
+    """Calibrated token estimate for BPE tokenizers: ~1 token per CJK/Hangul char,
+    ~2.5 chars per token for Greek/Cyrillic/Hebrew/Arabic/Thai, ~4 chars per token otherwise"""
+    text = str(text)
+    cjk = len(_CJK_PATTERN.findall(text))
+    non_latin = len(_NON_LATIN_PATTERN.findall(text))
+    latin = len(text) - cjk - non_latin
+    return cjk + int(non_latin / 2.5 + 0.5) + (latin + 3) // 4
+
+def get_retry_after(exc):
+    """Return the Retry-After seconds of a 429 error, None if it is not a rate limit error"""
+    response = getattr(exc, 'response', None)
+    status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return load_key("api.rate_limit_backoff", 5)
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def delay(self, amount):
+        # a single request larger than the whole bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+class EndpointLimiter:
+    def __init__(self, rpm=0, tpm=0):
+        self.cond = Condition()
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self._next_ticket = 0
+        self._serving = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _delay(self, amount, now):
+        delay = self.blocked_until - now
+        for bucket, need in ((self.requests, 1), (self.tokens, amount)):
+            if bucket:
+                bucket.refill(now)
+                delay = max(delay, bucket.delay(need))
+        return delay
+
+    def acquire(self, amount=0):
+        """Block until this caller is at the head of the queue and both budgets allow it"""
+        start = time.monotonic()
+        with self.cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self.waiting += 1
+            while True:
+                if ticket == self._serving:
+                    now = time.monotonic()
+                    delay = self._delay(amount, now)
+                    if delay <= 0:
+                        break
+                    self.cond.wait(delay)
+                else:
+                    self.cond.wait()
+            if self.requests:
+                self.requests.tokens -= 1
+            if self.tokens:
+                self.tokens.tokens -= amount
+            self._serving += 1
+            self.waiting -= 1
+            waited = time.monotonic() - start
+            self.acquired += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.cond.notify_all()
+        return waited
+
+    def settle(self, estimated, actual):
+        """Charge the difference between the estimated and the real token usage"""
+        if self.tokens and actual:
+            with self.cond:
+                self.tokens.tokens -= actual - estimated
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queue_depth": self.waiting,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+class RateLimiterRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        self._limiters = {}
+
+    def get(self, endpoint, rpm=None, tpm=None):
+        with self.lock:
+            limiter = self._limiters.get(endpoint)
+            if limiter is None:
+                limiter = self._limiters[endpoint] = EndpointLimiter(
+                    rpm=load_key("api.rpm", 0) if rpm is None else rpm,
+                    tpm=load_key("api.tpm", 0) if tpm is None else tpm)
+            return limiter
+
+    def call(self, endpoint, prompt, func, rpm=None, tpm=None):
+        """Run `func()` inside the endpoint budget, honoring Retry-After on 429 errors"""
+        limiter = self.get(endpoint, rpm, tpm)
+        estimated = estimate_tokens(prompt)
+        limiter.acquire(estimated)
+        try:
+            resp = func()
+        except Exception as e:
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                limiter.pause(retry_after)
+            raise
+        usage = getattr(resp, 'usage', None)
+        limiter.settle(estimated, getattr(usage, 'total_tokens', 0))
+        return resp
+
+    def report(self):
+        with self.lock:
+            items = list(self._limiters.items())
+        return {endpoint: limiter.stats() for endpoint, limiter in items}
+
+LIMITERS = RateLimiterRegistry()
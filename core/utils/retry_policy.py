@@ -0,0 +1,197 @@
+import time
+import random
+from threading import Condition, Lock
+import openai
+from rich import print as rprint
+from core.utils.config_utils import load_key
+
+# ------------
+# error classification
+# ------------
+
+VALIDATION = "validation"  # the endpoint answered but the content is unusable -> retry with a nudge
+TRANSPORT = "transport"    # timeouts, 429, 5xx, open circuit -> back off and retry
+FATAL = "fatal"            # bad key, bad request, exhausted budget -> fail fast
+
+class LLMValidationError(ValueError):
+    """The response was received but failed `valid_def` or could not be parsed"""
+
+class RetryBudgetExceeded(RuntimeError):
+    """The per-video retry budget is used up"""
+
+class CircuitOpenError(RuntimeError):
+    """The endpoint was still failing after its cooldown (the half-open probe failed)"""
+
+def classify_error(exc):
+    if isinstance(exc, RetryBudgetExceeded):
+        return FATAL
+    if isinstance(exc, (CircuitOpenError, openai.APIConnectionError, ConnectionError, TimeoutError)):
+        return TRANSPORT
+    status = getattr(exc, 'status_code', None)
+    if status is not None:
+        return TRANSPORT if status in (408, 409, 429) or status >= 500 else FATAL
+    return VALIDATION
+
+def is_context_length_error(exc):
+    """A request rejected for being too long: fatal for this prompt, but a smaller one can succeed"""
+    if getattr(exc, 'status_code', None) not in (400, 413):
+        return False
+    code = getattr(exc, 'code', None) or ''
+    message = str(exc).lower()
+    return code == 'context_length_exceeded' or any(
+        hint in message for hint in ('context length', 'context_length', 'maximum context', 'too many tokens', 'too long'))
+
+def is_fail_fast(exc):
+    """True if retrying the surrounding step is pointless (rejected request or exhausted budget).
+    A context-length error is not: the caller can retry with a smaller input."""
+    return classify_error(exc) == FATAL and not is_context_length_error(exc)
+
+def is_rate_limited(exc):
+    # a 429 says nothing about the endpoint's health, the limiter already pauses on Retry-After
+    return getattr(exc, 'status_code', None) == 429
+
+# ------------
+# circuit breaker per endpoint
+# ------------
+# An open circuit makes callers wait for the end of the cooldown instead of failing. Then one
+# probe call goes through (half-open) while the other callers wait for its result: they all
+# proceed if it succeeds, and get a CircuitOpenError (a transport error) if it fails.
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.cond = Condition()
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def before_call(self, endpoint):
+        """Wait until the endpoint may be called, return True if this call is the half-open probe"""
+        with self.cond:
+            seen = self.opened_at
+            while self.opened_at is not None:
+                if self.opened_at != seen:
+                    raise CircuitOpenError(f"Endpoint {endpoint} is unavailable after {self.failures} consecutive failures")
+                remaining = self.cooldown - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                elif self.probing:
+                    self.cond.wait()
+                else:
+                    self.probing = True
+                    return True
+            return False
+
+    def record(self, ok, probe=False):
+        """`ok=None` gives no verdict (e.g. rate limited): a probe only hands over to the next caller"""
+        with self.cond:
+            if probe:
+                self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            elif ok is not None:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+            self.cond.notify_all()
+
+# ------------
+# retry policy
+# ------------
+
+def nudge_prompt(prompt, exc, attempt):
+    return (f"{prompt}\n\nNote: your previous answer was rejected ({exc}). "
+            f"Follow the required output format exactly. (attempt {attempt + 1})")
+
+class RetryPolicy:
+    def __init__(self):
+        self.lock = Lock()
+        self._video_budgets = {}
+        self._breakers = {}
+
+    def _breaker(self, endpoint):
+        with self.lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(
+                    load_key("retry.breaker_threshold", 5), load_key("retry.breaker_cooldown", 60))
+            return breaker
+
+    def _take_video_budget(self, video_key):
+        with self.lock:
+            remaining = self._video_budgets.get(video_key, load_key("retry.per_video", 100))
+            if remaining <= 0:
+                return False
+            self._video_budgets[video_key] = remaining - 1
+            return True
+
+    def reset_video(self, video_key):
+        with self.lock:
+            self._video_budgets.pop(video_key, None)
+
+    def remaining(self, video_key):
+        with self.lock:
+            return self._video_budgets.get(video_key, load_key("retry.per_video", 100))
+
+    def backoff(self, attempt):
+        # full jitter keeps parallel threads from retrying in lock-step
+        cap = min(load_key("retry.max_delay", 30), load_key("retry.base_delay", 1) * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def is_open(self, endpoint):
+        with self.lock:
+            breaker = self._breakers.get(endpoint)
+        return breaker is not None and breaker.opened_at is not None and \
+            time.monotonic() - breaker.opened_at < breaker.cooldown
+
+    def run(self, func, prompt, router, video_key=None, label="GPT request"):
+        """Call `func(prompt, endpoint)` until it succeeds, nudging the prompt after validation failures
+        and failing over to another endpoint of `router` after transport failures"""
+        per_call = load_key("retry.per_call", 5)
+        attempt_prompt = prompt
+        attempt = 0
+        failed = set()
+        while True:
+            endpoint = router.acquire(exclude=failed, is_open=self.is_open)
+            breaker = self._breaker(endpoint.name)
+            delay = 0
+            probe = False
+            try:
+                probe = breaker.before_call(endpoint.base_url)
+                result = func(attempt_prompt, endpoint)
+                breaker.record(ok=True, probe=probe)
+                return result
+            except Exception as e:
+                kind = classify_error(e)
+                if isinstance(e, CircuitOpenError):
+                    pass  # the endpoint was not called
+                elif kind == FATAL or is_rate_limited(e):
+                    breaker.record(ok=None, probe=probe)
+                else:
+                    # a validation failure still proves the endpoint is alive
+                    breaker.record(ok=kind == VALIDATION, probe=probe)
+                rprint(f"[red]{label} failed on {endpoint.base_url} ({kind}): {e}, retry: {attempt + 1}/{per_call}[/red]")
+                # a rejected key only rules out this endpoint, not the request
+                key_rejected = getattr(e, 'status_code', None) in (401, 403) and \
+                    router.has_alternative(failed | {endpoint.name}, self.is_open)
+                if (kind == FATAL and not key_rejected) or attempt + 1 >= per_call:
+                    raise
+                if not self._take_video_budget(video_key):
+                    raise RetryBudgetExceeded(f"Retry budget exhausted for {video_key or 'default'}: {e}") from e
+                attempt += 1
+                if kind == VALIDATION:
+                    attempt_prompt = nudge_prompt(prompt, e, attempt)
+                else:
+                    failed.add(endpoint.name)
+                    if not router.has_alternative(failed, self.is_open):
+                        # every endpoint failed once, back off before trying them again
+                        failed.clear()
+                        delay = self.backoff(attempt)
+            finally:
+                router.release(endpoint)
+            if delay:
+                time.sleep(delay)
+
+RETRY = RetryPolicy()
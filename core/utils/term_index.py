@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+from threading import Lock
+
+# ------------
+# terminology index
+# ------------
+# terminology.json is loaded once per video into an Aho–Corasick automaton over the lowercased
+# `src` terms, so finding the terms of a chunk is one pass over its text whatever the number of
+# terms. A term edge made of a spaced-script letter or digit only matches at a word boundary
+# ("cat" is not found in "category"); CJK/kana edges match anywhere, as before.
+# The index is read-only once built and shared by all translation threads.
+
+def _is_spaced_word_char(char):
+    # letters and digits of scripts that separate words with spaces
+    return char.isalnum() and ord(char) < 0x2E80
+
+class TermIndex:
+    def __init__(self, terms):
+        self.terms = terms
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for i, term in enumerate(terms):
+            pattern = str(term['src']).lower()
+            if pattern:
+                self._add(pattern, i)
+        self._build()
+
+    def _add(self, pattern, term_index):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((term_index, len(pattern)))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0) if self._goto[fail].get(char, 0) != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Indexes (into `terms`) of the terms found in `text`, in terminology order"""
+        text = text.lower()
+        found = set()
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for term_index, length in self._out[state]:
+                if term_index not in found and self._at_boundary(text, end - length, end):
+                    found.add(term_index)
+        return sorted(found)
+
+    @staticmethod
+    def _at_boundary(text, start, end):
+        if _is_spaced_word_char(text[start]) and start > 0 and _is_spaced_word_char(text[start - 1]):
+            return False
+        if _is_spaced_word_char(text[end - 1]) and end < len(text) and _is_spaced_word_char(text[end]):
+            return False
+        return True
+
+    def fingerprint(self, text):
+        """Hash of the terms (src and tgt) that occur in `text`, empty if none do"""
+        found = self.find(text)
+        if not found:
+            return ''
+        raw = json.dumps(sorted([str(self.terms[i]['src']), str(self.terms[i]['tgt'])] for i in found), ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def prompt(self, text):
+        """The "things to note" prompt for `text`, None if no term occurs in it"""
+        found = self.find(text)
+        if not found:
+            return None
+        # terms sharing a found `src` are listed too, numbered by their position in the terminology
+        sources = {self.terms[i]['src'] for i in found}
+        return '\n'.join(
+            f'{i+1}. "{term["src"]}": "{term["tgt"]}",'
+            f' meaning: {term["note"]}'
+            for i, term in enumerate(self.terms)
+            if term['src'] in sources
+        )
+
+_INDEXES = {}
+_INDEXES_LOCK = Lock()
+
+def get_term_index(TERMINOLOGY):
+    """The index of a terminology file, rebuilt only when the file changes"""
+    stat = os.stat(TERMINOLOGY)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _INDEXES_LOCK:
+        cached = _INDEXES.get(TERMINOLOGY)
+        if cached and cached[0] == version:
+            return cached[1]
+        with open(TERMINOLOGY, 'r', encoding='utf-8') as file:
+            index = TermIndex(json.load(file)['terms'])
+        _INDEXES[TERMINOLOGY] = (version, index)
+        return index
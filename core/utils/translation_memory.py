@@ -0,0 +1,151 @@
+import os
+import math
+import time
+import zlib
+import sqlite3
+import hashlib
+from threading import Lock
+from core.utils.config_utils import load_key
+
+# ------------
+# translation memory shared across videos
+# ------------
+# Every translated line is stored under (source line, source language, target language,
+# terminology fingerprint). The fingerprint only covers the terms that occur in the line, so
+# editing an unrelated term keeps the entry valid. An exact hit can replace the llm; fuzzy
+# candidates (character trigram dice score above `translation_memory.fuzzy_threshold`) are
+# only given to the llm as references. The trigram index is stored as (crc32, segment id)
+# integer pairs in a WITHOUT ROWID table, with the number of segments of every trigram kept
+# in `gram_counts`. A fuzzy lookup only reads the postings of the rarest query trigrams: a line
+# that reaches the threshold shares enough trigrams with the query to contain one of them.
+
+def normalize_line(line):
+    return ' '.join(str(line).split())
+
+def _grams(line):
+    text = normalize_line(line).lower()
+    if len(text) < 3:
+        return {zlib.crc32(text.encode('utf-8'))} if text else set()
+    return {zlib.crc32(text[i:i + 3].encode('utf-8')) for i in range(len(text) - 2)}
+
+def _segment_key(src, src_lang, tgt_lang, term_fp):
+    raw = '\x1f'.join([normalize_line(src), str(src_lang), str(tgt_lang), term_fp or ''])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class TranslationMemory:
+    # candidates read from the rare postings before scoring
+    MAX_CANDIDATES = 256
+
+    def __init__(self, path, fuzzy_threshold=0.75):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self.lock = Lock()
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS segments (
+            id INTEGER PRIMARY KEY, key TEXT UNIQUE, src TEXT, tgt TEXT, src_lang TEXT, tgt_lang TEXT,
+            n_grams INTEGER, uses INTEGER, last_used REAL)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS grams (
+            gram INTEGER, segment INTEGER, PRIMARY KEY (gram, segment)) WITHOUT ROWID""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS gram_counts (gram INTEGER PRIMARY KEY, n INTEGER)")
+        # memories written before `gram_counts` existed
+        if self.conn.execute("SELECT 1 FROM gram_counts LIMIT 1").fetchone() is None:
+            self.conn.execute("INSERT INTO gram_counts SELECT gram, COUNT(*) FROM grams GROUP BY gram")
+        self.conn.commit()
+
+    def get(self, src, src_lang, tgt_lang, term_fp):
+        """Exact hit: the stored translation of this line under the same terminology, else None"""
+        key = _segment_key(src, src_lang, tgt_lang, term_fp)
+        with self.lock:
+            row = self.conn.execute("SELECT tgt FROM segments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.exact_hits += 1
+            self.conn.execute("UPDATE segments SET uses = uses + 1, last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return row[0]
+
+    def _in_batches(self, sql, values, *params, size=900):
+        """Run `sql` with its `{}` expanded to placeholders over `values` in batches, sqlite limits bound parameters"""
+        rows = []
+        for i in range(0, len(values), size):
+            part = values[i:i + size]
+            rows += self.conn.execute(sql.format(','.join('?' * len(part))), (*part, *params)).fetchall()
+        return rows
+
+    def fuzzy(self, src, src_lang, tgt_lang, limit=3):
+        """[(score, src, tgt)] of the most similar stored lines above the threshold"""
+        grams = sorted(_grams(src))
+        if not grams:
+            return []
+        t = self.fuzzy_threshold
+        # a line with a dice score >= t has between t/(2-t) and (2-t)/t times the query's trigrams
+        # and shares at least t/(2-t) of them, so it holds one of the rarest `len - min_shared + 1`
+        min_shared = max(1, math.ceil(t * len(grams) / (2 - t)))
+        with self.lock:
+            counts = dict(self._in_batches("SELECT gram, n FROM gram_counts WHERE gram IN ({})", grams))
+            present = sorted(counts, key=counts.get)
+            rare = present[:len(grams) - min_shared + 1][:900]
+            segments = [row[0] for row in self._in_batches("""
+                SELECT DISTINCT g.segment FROM grams g JOIN segments s ON s.id = g.segment
+                WHERE g.gram IN ({}) AND s.src_lang = ? AND s.tgt_lang = ? AND s.n_grams BETWEEN ? AND ?
+                LIMIT ?""", rare, src_lang, tgt_lang, t * len(grams) / (2 - t), len(grams) * (2 - t) / t,
+                self.MAX_CANDIDATES)]
+            shared = {}
+            if segments:
+                for segment, n in self._in_batches(f"""
+                        SELECT segment, COUNT(*) FROM grams WHERE gram IN ({{}}) AND segment IN ({','.join('?' * len(segments))})
+                        GROUP BY segment""", present, *segments, size=600):
+                    shared[segment] = shared.get(segment, 0) + n
+            rows = self._in_batches("SELECT id, src, tgt, n_grams FROM segments WHERE id IN ({})", list(shared))
+        scored = sorted(((2 * shared[segment] / (len(grams) + n_grams), src_line, tgt) for segment, src_line, tgt, n_grams in rows),
+                        reverse=True)
+        candidates = [c for c in scored if c[0] >= self.fuzzy_threshold][:limit]
+        with self.lock:
+            if candidates:
+                self.fuzzy_hits += 1
+            else:
+                self.misses += 1
+        return candidates
+
+    def put(self, src, tgt, src_lang, tgt_lang, term_fp):
+        key = _segment_key(src, src_lang, tgt_lang, term_fp)
+        grams = _grams(src)
+        with self.lock:
+            row = self.conn.execute("SELECT id FROM segments WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE segments SET tgt = ?, last_used = ? WHERE id = ?", (tgt, time.time(), row[0]))
+            else:
+                cursor = self.conn.execute("INSERT INTO segments (key, src, tgt, src_lang, tgt_lang, n_grams, uses, last_used) "
+                                           "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                                           (key, normalize_line(src), tgt, src_lang, tgt_lang, len(grams), time.time()))
+                self.conn.executemany("INSERT OR IGNORE INTO grams VALUES (?, ?)", [(g, cursor.lastrowid) for g in grams])
+                self.conn.executemany("INSERT INTO gram_counts VALUES (?, 1) ON CONFLICT(gram) DO UPDATE SET n = n + 1",
+                                      [(g,) for g in grams])
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            lookups = self.exact_hits + self.fuzzy_hits + self.misses
+            return {"entries": entries, "exact_hits": self.exact_hits, "fuzzy_hits": self.fuzzy_hits, "misses": self.misses,
+                    "exact_hit_rate": self.exact_hits / lookups if lookups else 0.0,
+                    "hit_rate": (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0}
+
+_MEMORY = None
+_MEMORY_LOCK = Lock()
+
+def get_translation_memory():
+    """Return the shared TranslationMemory, or None when `translation_memory.enabled` is off"""
+    global _MEMORY
+    if not load_key("translation_memory.enabled", False):
+        return None
+    with _MEMORY_LOCK:
+        if _MEMORY is None:
+            _MEMORY = TranslationMemory(load_key("translation_memory.path", "cache/translation_memory.db"),
+                                        fuzzy_threshold=load_key("translation_memory.fuzzy_threshold", 0.75))
+        return _MEMORY
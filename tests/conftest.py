@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.utils import config_utils
+
+# `api` comes last: appended indented keys extend it, unindented ones are new sections
+BASE_CONFIG = """max_workers: 4
+api:
+  key: test-key
+  base_url: http://127.0.0.1:1/v1
+  model: fake-model
+  llm_support_json: false
+  health_check_interval: 0
+"""
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Point load_key at a minimal config.yaml, call the fixture with extra yaml to rewrite it"""
+    path = tmp_path / "config.yaml"
+    def write(extra=""):
+        path.write_text(BASE_CONFIG + extra, encoding="utf-8")
+    write()
+    monkeypatch.setattr(config_utils, "CONFIG_PATH", str(path))
+    monkeypatch.chdir(tmp_path)
+    return write
+
+# ------------
+# local stand-in for an OpenAI-compatible endpoint
+# ------------
+# Serves /v1/models (the health check), /v1/chat/completions and the files/batches routes of
+# the batch api. `answer(prompt)` builds the completion text, `delay` slows every chat call
+# down and `healthy = False` makes every route answer 503. `chat_failures` holds
+# (status, headers[, error]) answers for the next chat calls, e.g. a 429 with Retry-After.
+
+class FakeLLMServer:
+    def __init__(self, answer=lambda prompt: "ok", delay=0.0, polls_until_done=1):
+        self.answer = answer
+        self.delay = delay
+        self.healthy = True
+        self.polls_until_done = polls_until_done
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.chat_calls = 0
+        self.chat_times = []
+        self.chat_failures = []
+        self.batches = {}
+        self.files = {}
+        self.submitted = []
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like a real endpoint
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                server._handle(self, "GET")
+            def do_POST(self):
+                server._handle(self, "POST")
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def completion(self, prompt):
+        content = self.answer(prompt)
+        return {"id": "chatcmpl-test", "object": "chat.completion", "created": int(time.time()), "model": "fake-model",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)}}
+
+    def _send(self, handler, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler, method):
+        path = handler.path.split("?")[0]
+        body = handler.rfile.read(int(handler.headers.get("Content-Length") or 0)) if method == "POST" else b""
+        with self.lock:
+            self.requests += 1
+        if not self.healthy:
+            return self._send(handler, 503, {"error": {"message": "unavailable"}})
+        if method == "GET" and path == "/v1/models":
+            return self._send(handler, 200, {"object": "list", "data": [
+                {"id": "fake-model", "object": "model", "created": 0, "owned_by": "test"}]})
+        if method == "POST" and path == "/v1/chat/completions":
+            with self.lock:
+                self.chat_calls += 1
+                self.chat_times.append(time.monotonic())
+                failure = self.chat_failures.pop(0) if self.chat_failures else None
+            if failure:
+                error = failure[2] if len(failure) > 2 else {"message": f"status {failure[0]}"}
+                return self._send(handler, failure[0], {"error": error}, headers=failure[1])
+            time.sleep(self.delay)
+            return self._send(handler, 200, self.completion(json.loads(body)["messages"][-1]["content"]))
+        if method == "POST" and path == "/v1/files":
+            return self._send(handler, 200, self._create_file(handler.headers["Content-Type"], body))
+        if method == "GET" and path.startswith("/v1/files/") and path.endswith("/content"):
+            return self._send(handler, 200, self.files[path.split("/")[3]], content_type="application/octet-stream")
+        if method == "POST" and path == "/v1/batches":
+            return self._send(handler, 200, self._create_batch(json.loads(body)))
+        if method == "GET" and path.startswith("/v1/batches/"):
+            return self._send(handler, 200, self._poll_batch(path.split("/")[3]))
+        self._send(handler, 404, {"error": {"message": f"no route {method} {path}"}})
+
+    def _create_file(self, content_type, body):
+        boundary = content_type.split("boundary=")[1].strip('"').encode()
+        for part in body.split(b"--" + boundary):
+            if b'name="file"' in part:
+                content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+        with self.lock:
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                "filename": "batch_requests.jsonl", "purpose": "batch", "status": "processed"}
+
+    def _create_batch(self, request):
+        lines = [json.loads(line) for line in self.files[request["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+        with self.lock:
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {"lines": lines, "polls": 0, "output_file_id": None}
+            self.submitted.append(batch_id)
+        return self._batch_object(batch_id, request["input_file_id"], "validating")
+
+    def _poll_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch["polls"] += 1
+            if batch["polls"] >= self.polls_until_done and batch["output_file_id"] is None:
+                output = "\n".join(json.dumps({"custom_id": line["custom_id"], "response": {
+                    "status_code": 200, "body": self.completion(line["body"]["messages"][-1]["content"])}})
+                    for line in batch["lines"])
+                batch["output_file_id"] = f"file-{len(self.files)}"
+                self.files[batch["output_file_id"]] = output.encode("utf-8")
+            done = batch["output_file_id"] is not None
+        return self._batch_object(batch_id, "file-input", "completed" if done else "in_progress", batch["output_file_id"])
+
+    def _batch_object(self, batch_id, input_file_id, status, output_file_id=None):
+        return {"id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+                "created_at": 0, "input_file_id": input_file_id, "status": status, "output_file_id": output_file_id}
+
+@pytest.fixture
+def fake_llm():
+    """Start stand-in servers with `fake_llm(**options)`, all stopped after the test"""
+    servers = []
+    def start(**options):
+        server = FakeLLMServer(**options)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,44 @@
+import os
+import shutil
+from core.utils.gpt_cache import get_cache, GlobalStore
+
+def test_moved_log_folder_is_not_served_from_memory(tmp_path):
+    GPT_LOG_FOLDER = str(tmp_path / "output" / "gpt_log")
+    cache = get_cache(GPT_LOG_FOLDER, "translate")
+    cache.append("model", "prompt", "answer", None, "answer")
+    assert get_cache(GPT_LOG_FOLDER, "translate").get("model", "prompt", None) == "answer"
+
+    # cleanup() moves the output of a finished video away
+    shutil.move(str(tmp_path / "output"), str(tmp_path / "history"))
+    assert get_cache(GPT_LOG_FOLDER, "translate").get("model", "prompt", None) is None
+    assert len(get_cache(GPT_LOG_FOLDER, "translate")) == 0
+
+def test_deleted_log_forces_a_new_answer(tmp_path):
+    GPT_LOG_FOLDER = str(tmp_path / "gpt_log")
+    cache = get_cache(GPT_LOG_FOLDER, "summary")
+    cache.append("model", "prompt", "old", None, "old")
+    os.remove(cache.file)
+    assert cache.get("model", "prompt", None) is None
+    cache.append("model", "prompt", "new", None, "new")
+    assert cache.get("model", "prompt", None) == "new"
+    with open(cache.file, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_global_store_counts_in_memory_and_defers_touches(tmp_path):
+    store = GlobalStore(str(tmp_path / "store.db"), max_entries=10)
+    for i in range(10):
+        store.put("m", f"p{i}", "json", {"i": i})
+    # replacing a key does not grow the count
+    store.put("m", "p5", "json", {"i": 5})
+    assert store.stats()["entries"] == 10
+    # a hit is buffered, the oldest row survives the eviction because the touch is flushed first
+    assert store.get("m", "p0", "json") == {"i": 0}
+    assert store._touched
+    store.put("m", "p10", "json", {"i": 10})
+    assert store.get("m", "p0", "json") == {"i": 0}
+    assert store.get("m", "p1", "json") is None
+    assert store.stats()["entries"] == store.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    store.close()
+    reopened = GlobalStore(str(tmp_path / "store.db"), max_entries=10)
+    assert reopened.stats()["entries"] <= 10
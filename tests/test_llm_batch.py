@@ -0,0 +1,79 @@
+import json
+import pytest
+from core.utils.ask_gpt import ask_gpt
+from core.utils.llm_batch import BatchPending, run_batched
+
+def batch_config(server, max_wait=60):
+    return f"""  endpoints:
+    - {{base_url: "{server.base_url}", key: test-key}}
+batch_api:
+  enabled: true
+  poll_interval: 0.01
+  max_wait: {max_wait}
+  max_rounds: 4
+"""
+
+def two_step_stage(GPT_LOG_FOLDER):
+    """A stage whose second prompt depends on the answer to the first one"""
+    first = ask_gpt("first question", log_title="round_one", GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+    return first, ask_gpt(f"follow-up to <{first}>", log_title="round_two", GPT_LOG_FOLDER=GPT_LOG_FOLDER)
+
+def collect_stage(GPT_LOG_FOLDER):
+    def collect():
+        try:
+            two_step_stage(GPT_LOG_FOLDER)
+        except BatchPending:
+            pass
+    return collect
+
+@pytest.fixture
+def server(fake_llm):
+    return fake_llm(answer=lambda prompt: f"answer to {prompt}")
+
+def test_rounds_prefill_every_prompt(config, server, tmp_path):
+    config(batch_config(server))
+    GPT_LOG_FOLDER = str(tmp_path / "gpt_log")
+    run_batched(collect_stage(GPT_LOG_FOLDER), GPT_LOG_FOLDER, str(tmp_path / "batch_state.json"))
+    # one batch per round: the follow-up is only known once the first answer is in
+    assert len(server.submitted) == 2
+    assert server.chat_calls == 0
+
+    first, second = two_step_stage(GPT_LOG_FOLDER)
+    assert first == "answer to first question"
+    assert second == "answer to follow-up to <answer to first question>"
+    assert server.chat_calls == 0
+
+    with open(tmp_path / "batch_state.json", encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["pending"] == {} and state["done"] == server.submitted
+
+def test_restarted_run_resumes_pending_batch(config, fake_llm, tmp_path):
+    server = fake_llm(answer=lambda prompt: f"answer to {prompt}", polls_until_done=3)
+    GPT_LOG_FOLDER = str(tmp_path / "gpt_log")
+    STATE_FILE = str(tmp_path / "batch_state.json")
+    # the first run stops while the batch is still in progress
+    config(batch_config(server, max_wait=0))
+    with pytest.raises(TimeoutError):
+        run_batched(collect_stage(GPT_LOG_FOLDER), GPT_LOG_FOLDER, STATE_FILE)
+    with open(STATE_FILE, encoding="utf-8") as f:
+        assert list(json.load(f)["pending"].values()) == server.submitted
+
+    # the next run polls the saved batch instead of submitting the prompt again
+    config(batch_config(server))
+    run_batched(collect_stage(GPT_LOG_FOLDER), GPT_LOG_FOLDER, STATE_FILE)
+    assert server.submitted == ["batch-0", "batch-1"]
+    assert server.batches["batch-0"]["polls"] >= 3
+
+    assert two_step_stage(GPT_LOG_FOLDER)[1] == "answer to follow-up to <answer to first question>"
+    assert server.chat_calls == 0
+
+def test_missing_batch_results_are_requested_live(config, server, tmp_path):
+    GPT_LOG_FOLDER = str(tmp_path / "gpt_log")
+    # only the first round is prefetched
+    config(batch_config(server).replace("max_rounds: 4", "max_rounds: 1"))
+    run_batched(collect_stage(GPT_LOG_FOLDER), GPT_LOG_FOLDER, str(tmp_path / "batch_state.json"))
+    assert len(server.submitted) == 1
+
+    first, second = two_step_stage(GPT_LOG_FOLDER)
+    assert second == "answer to follow-up to <answer to first question>"
+    assert server.chat_calls == 1
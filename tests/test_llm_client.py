@@ -0,0 +1,40 @@
+import concurrent.futures
+import openai
+import pytest
+from core.utils.ask_gpt import ask_gpt
+from core.utils.llm_client import ClientRegistry
+
+def chat(clients, server, i):
+    return clients.chat(server.base_url, "test-key", model="fake-model", messages=[{"role": "user", "content": f"line {i}"}])
+
+def test_reuse_is_measured_on_the_connection_pool(config, fake_llm):
+    server = fake_llm()
+    clients = ClientRegistry()
+    for i in range(5):
+        chat(clients, server, i)
+    stats = clients.report()[server.base_url]
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1 and stats["reused"] == 4
+    clients.close()
+
+def test_parallel_requests_open_their_own_connections(config, fake_llm):
+    server = fake_llm(delay=0.2)
+    clients = ClientRegistry()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda i: chat(clients, server, i), range(4)))
+    stats = clients.report()[server.base_url]
+    # four requests in flight at once cannot share a connection
+    assert stats["connections"] == 4 and stats["reused"] == 0
+    clients.close()
+
+def test_sdk_does_not_retry_behind_the_retry_policy(config, fake_llm, tmp_path):
+    server = fake_llm()
+    config(f"""  endpoints:
+    - {{base_url: "{server.base_url}", key: test-key}}
+retry:
+  per_call: 1
+""")
+    server.healthy = False
+    with pytest.raises(openai.InternalServerError):
+        ask_gpt("hello", log_title="sdk_retries", GPT_LOG_FOLDER=str(tmp_path / "gpt_log"))
+    assert server.requests == 1
@@ -0,0 +1,88 @@
+import concurrent.futures
+from core.utils import config_utils
+from core.utils.llm_client import CLIENTS
+from core.utils.llm_router import EndpointRouter, _parse_specs
+
+def make_router(*servers, weights=None):
+    specs = _parse_specs([{"base_url": server.base_url, "key": "test-key", "weight": (weights or {}).get(i, 1)}
+                          for i, server in enumerate(servers)])
+    return EndpointRouter(lambda: specs)
+
+def test_acquire_prefers_least_outstanding(config, fake_llm):
+    a, b = fake_llm(), fake_llm()
+    router = make_router(a, b)
+    first, second = router.acquire(), router.acquire()
+    assert {first.base_url, second.base_url} == {a.base_url, b.base_url}
+    router.release(first)
+    # `first` is idle again while `second` is still busy
+    assert router.acquire().name == first.name
+
+def test_acquire_follows_weights(config, fake_llm):
+    a, b = fake_llm(), fake_llm()
+    router = make_router(a, b, weights={1: 2})
+    picked = [router.acquire().base_url for _ in range(6)]
+    assert picked.count(b.base_url) == 4 and picked.count(a.base_url) == 2
+
+def test_slow_endpoint_gets_less_traffic(config, fake_llm):
+    slow, fast = fake_llm(delay=0.3), fake_llm(delay=0.01)
+    router = make_router(slow, fast)
+    def call(i):
+        endpoint = router.acquire()
+        try:
+            CLIENTS.chat(endpoint.base_url, endpoint.api_key, model="fake-model",
+                         messages=[{"role": "user", "content": f"line {i}"}])
+        finally:
+            router.release(endpoint)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(call, range(40)))
+    assert slow.chat_calls + fast.chat_calls == 40
+    assert fast.chat_calls > 2 * slow.chat_calls
+
+def test_health_check_removes_and_readmits_endpoint(config, fake_llm):
+    a, b = fake_llm(), fake_llm()
+    router = make_router(a, b)
+    b.healthy = False
+    router.health_check(timeout=2)
+    health = {e["base_url"]: e["healthy"] for e in router.report().values()}
+    assert health == {a.base_url: True, b.base_url: False}
+    # even with `a` busy, the unhealthy endpoint is not picked
+    held = [router.acquire() for _ in range(3)]
+    assert all(e.base_url == a.base_url for e in held)
+    for endpoint in held:
+        router.release(endpoint)
+
+    b.healthy = True
+    router.health_check(timeout=2)
+    held = [router.acquire() for _ in range(2)]
+    assert {e.base_url for e in held} == {a.base_url, b.base_url}
+
+def test_unhealthy_everywhere_still_routes(config, fake_llm):
+    a = fake_llm()
+    router = make_router(a)
+    a.healthy = False
+    router.health_check(timeout=2)
+    # with no healthy endpoint left, requests still go out instead of failing in the router
+    assert router.acquire().base_url == a.base_url
+
+def test_acquire_does_not_reparse_config(config, fake_llm, monkeypatch):
+    a = fake_llm()
+    config(f"""  endpoints:
+    - {{base_url: "{a.base_url}", key: test-key}}
+""")
+    router = EndpointRouter()
+    router.release(router.acquire())
+    parses = []
+    load = config_utils.yaml.load
+    monkeypatch.setattr(config_utils.yaml, "load", lambda stream: parses.append(1) or load(stream))
+    for _ in range(20):
+        router.release(router.acquire())
+    assert parses == []
+    # a config change is still picked up
+    b = fake_llm()
+    config(f"""  endpoints:
+    - {{base_url: "{a.base_url}", key: test-key}}
+    - {{base_url: "{b.base_url}", key: test-key}}
+""")
+    held = [router.acquire() for _ in range(2)]
+    assert {e.base_url for e in held} == {a.base_url, b.base_url}
+    assert len(parses) == 1
@@ -0,0 +1,23 @@
+import json
+from core.utils.ask_gpt import write_llm_report
+from core.utils.llm_stats import STATS, video_of
+
+def test_batch_videos_get_their_own_report(config, tmp_path):
+    # batch mode runs every video in `output`, so all of them share one GPT_LOG_FOLDER
+    GPT_LOG_FOLDER = str(tmp_path / "output" / "gpt_log")
+    video = video_of(GPT_LOG_FOLDER)
+    STATS.reset_video(video)
+    STATS.record(GPT_LOG_FOLDER, "translate", calls=5, requests=5)
+    STATS.reset_video(video)
+    STATS.record(GPT_LOG_FOLDER, "translate", calls=2, requests=1, cache_hits=1)
+
+    report = write_llm_report(str(tmp_path / "llm_report.json"), GPT_LOG_FOLDER)
+    assert report["by_title"][video]["translate"]["calls"] == 2
+    assert report["totals"]["requests"] == 1
+    # process-wide sections are left to the report without a video
+    assert "endpoints" not in report and "rate_limits" not in report
+    with open(tmp_path / "llm_report.json", encoding="utf-8") as f:
+        assert json.load(f)["totals"]["cache_hits"] == 1
+
+    process_report = write_llm_report(str(tmp_path / "process_report.json"))
+    assert "endpoints" in process_report and "rate_limits" in process_report
@@ -0,0 +1,38 @@
+import time
+import threading
+from core.utils.ask_gpt import ask_gpt
+from core.utils.llm_router import Endpoint
+from core.utils.rate_limiter import LIMITERS
+from core.utils.retry_policy import RETRY
+
+def test_429_pauses_the_whole_endpoint(config, fake_llm, tmp_path):
+    server = fake_llm()
+    config(f"""  endpoints:
+    - {{base_url: "{server.base_url}", key: test-key}}
+retry:
+  per_call: 3
+  per_video: 10
+  base_delay: 0.01
+  max_delay: 0.02
+""")
+    GPT_LOG_FOLDER = str(tmp_path / "gpt_log")
+    server.chat_failures = [(429, {"retry-after": "0.5"})]
+    answers = []
+    def ask(prompt):
+        answers.append(ask_gpt(prompt, log_title="rate_limited", GPT_LOG_FOLDER=GPT_LOG_FOLDER))
+    first = threading.Thread(target=ask, args=("first",))
+    first.start()
+    time.sleep(0.1)
+    # a second thread arriving during the pause waits too, instead of hitting the endpoint
+    second = threading.Thread(target=ask, args=("second",))
+    second.start()
+    first.join()
+    second.join()
+
+    assert sorted(answers) == ["ok", "ok"]
+    assert server.chat_calls == 3
+    throttled_at = server.chat_times[0]
+    assert all(t - throttled_at >= 0.45 for t in server.chat_times[1:])
+    # the 429 went through the limiter (one pause) and the retry policy (one retry of the budget)
+    assert LIMITERS.report()[Endpoint(server.base_url, "test-key").name]["throttled"] == 1
+    assert RETRY.remaining(GPT_LOG_FOLDER) == 9
@@ -0,0 +1,30 @@
+import openai
+import pytest
+from core.utils.ask_gpt import ask_gpt
+from core.utils.retry_policy import is_fail_fast
+
+CONTEXT_LENGTH_ERROR = {"message": "This model's maximum context length is 8192 tokens. However, your messages resulted in 9100 tokens.",
+                        "type": "invalid_request_error", "code": "context_length_exceeded"}
+
+@pytest.fixture
+def server(config, fake_llm):
+    server = fake_llm()
+    config(f"""  endpoints:
+    - {{base_url: "{server.base_url}", key: test-key}}
+""")
+    return server
+
+def test_context_length_error_lets_the_caller_shrink_the_input(server, tmp_path):
+    server.chat_failures = [(400, {}, CONTEXT_LENGTH_ERROR)]
+    with pytest.raises(openai.BadRequestError) as error:
+        ask_gpt("a very long chunk", log_title="too_long", GPT_LOG_FOLDER=str(tmp_path / "gpt_log"))
+    # the same prompt is not sent again, but the step can retry with smaller chunks
+    assert server.chat_calls == 1
+    assert not is_fail_fast(error.value)
+
+def test_other_bad_requests_fail_fast(server, tmp_path):
+    server.chat_failures = [(400, {}, {"message": "Invalid value for 'model'", "type": "invalid_request_error"})]
+    with pytest.raises(openai.BadRequestError) as error:
+        ask_gpt("hello", log_title="bad_request", GPT_LOG_FOLDER=str(tmp_path / "gpt_log"))
+    assert server.chat_calls == 1
+    assert is_fail_fast(error.value)
@@ -0,0 +1,98 @@
+import random
+from difflib import SequenceMatcher
+import pytest
+from core.split_align import align_split_positions
+
+def find_split_positions_legacy(original, modified, joiner):
+    """The former quadratic scan of _3_2_split_meaning, the reference the aligner must match"""
+    split_positions = []
+    parts = modified.split('[br]')
+    start = 0
+    for i in range(len(parts) - 1):
+        max_similarity = 0
+        best_split = None
+        for j in range(start, len(original)):
+            left_similarity = SequenceMatcher(None, original[start:j], joiner.join(parts[i].split())).ratio()
+            if left_similarity > max_similarity:
+                max_similarity = left_similarity
+                best_split = j
+        if best_split is not None:
+            split_positions.append(best_split)
+            start = best_split
+    return split_positions
+
+CASES = [
+    ("Which makes no sense to the average guy who always pushes the character creation slider all the way to the right.",
+     "Which makes no sense to the average guy[br]who always pushes the character creation slider all the way to the right.", " "),
+    ("So in the same frame, right there, almost in the exact same spot on the ice, Brown has committed himself, whereas McDavid has not.",
+     "So in the same frame, right there,[br]almost in the exact same spot on the ice,[br]Brown has committed himself, whereas McDavid has not.", " "),
+    ("平口さんの盛り上げごまが初めて売れました本当に嬉しいです本当にやっぱり見た瞬間いいって言ってくれる",
+     "平口さんの盛り上げごまが初めて売れました[br]本当に嬉しいです本当にやっぱり見た瞬間いいって言ってくれる", ""),
+    ("and show the specific differences that make a difference between a breakaway that results in a goal in the NHL versus one that doesn't.",
+     "And show the specific differences that make a difference[br]between a breakaway that results in a goal in the NHL versus one that doesn't", " "),
+    # filler dropped by the llm at a part boundary belongs to the following part
+    ("I went to the store, um, and bought some milk for the kids.",
+     "I went to the store,[br]and bought some milk for the kids.", " "),
+    ("So basically you know what I mean, uh, we tried it again and it worked.",
+     "So basically you know what I mean,[br]we tried it again and it worked.", " "),
+    ("Well the thing is like, you know, the players were tired after the game, so, uh, the coach called a timeout.",
+     "Well the thing is like,[br]the players were tired after the game,[br]the coach called a timeout.", " "),
+]
+
+@pytest.mark.parametrize("original, modified, joiner", CASES)
+def test_same_positions_as_legacy_scan(original, modified, joiner):
+    assert align_split_positions(original, modified)[0] == find_split_positions_legacy(original, modified, joiner)
+
+def test_dropped_filler_goes_with_the_following_part():
+    original = "I went to the store, um, and bought some milk for the kids."
+    positions, similarity = align_split_positions(original, "I went to the store,[br]and bought some milk for the kids.")
+    assert original[:positions[0]] == "I went to the store,"
+    assert similarity < 1.0
+
+def random_split(rng):
+    """A sentence and an llm-like split of it: marks between words, fillers dropped at some marks,
+    first letter capitalized or final period added now and then"""
+    words = "the a player team game ice puck shot goal coach season fans we they really very quickly went made took scored".split()
+    fillers = ["um,", "uh,", "you know,", "like,", "so,", "I mean,"]
+    sentence = [rng.choice(words) for _ in range(rng.randint(8, 40))]
+    cuts = set(rng.sample(range(2, len(sentence) - 1), min(rng.randint(1, 3), len(sentence) - 3)))
+    original, modified = [], []
+    for k, word in enumerate(sentence):
+        if k in cuts:
+            if rng.random() < 0.5:
+                original.append(rng.choice(fillers))
+            modified.append('[br]')
+        original.append(word)
+        modified.append(word)
+    modified = ' '.join(modified).replace(' [br] ', '[br]')
+    if rng.random() < 0.3:
+        modified = modified[0].upper() + modified[1:]
+    if rng.random() < 0.3:
+        modified += '.'
+    return ' '.join(original), modified
+
+def test_seeded_fuzz_matches_legacy_scan():
+    rng = random.Random(20240611)
+    compared = 0
+    for _ in range(300):
+        original, modified = random_split(rng)
+        legacy = find_split_positions_legacy(original, modified, " ")
+        # the legacy scan sometimes cuts inside a word on short repeated parts, that is not a reference
+        if any(0 < p < len(original) and not original[p].isspace() for p in legacy):
+            continue
+        assert align_split_positions(original, modified)[0] == legacy, (original, modified)
+        compared += 1
+    assert compared >= 290
+
+if __name__ == '__main__':
+    # microbenchmark: PYTHONPATH=. python tests/test_split_align.py
+    import time
+    for original, modified, joiner in CASES:
+        start = time.perf_counter()
+        legacy = find_split_positions_legacy(original, modified, joiner)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        fast, similarity = align_split_positions(original, modified)
+        fast_time = time.perf_counter() - start
+        print(f"{'same' if legacy == fast else 'DIFF'} legacy={legacy} fast={fast} sim={similarity:.3f} "
+              f"legacy {legacy_time * 1000:.1f}ms / fast {fast_time * 1000:.2f}ms ({legacy_time / fast_time:.0f}x)")
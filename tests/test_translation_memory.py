@@ -0,0 +1,28 @@
+import sqlite3
+from core.utils.translation_memory import TranslationMemory
+
+
+def test_fuzzy_finds_the_close_line_among_common_trigrams(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.db"), fuzzy_threshold=0.75)
+    # many lines share the frequent trigrams of the query, only one is close to it
+    for i in range(500):
+        memory.put(f"the model and the data {i}", f"t{i}", "en", "zh", "")
+    memory.put("the gradient of the loss goes down", "close", "en", "zh", "")
+    memory.put("the gradient of the loss goes down", "other language", "en", "fr", "")
+    found = memory.fuzzy("the gradient of the loss went down", "en", "zh")
+    assert [tgt for _, _, tgt in found] == ["close"]
+    assert found[0][0] >= 0.75
+    assert memory.fuzzy("something entirely unrelated here", "en", "zh") == []
+
+
+def test_gram_counts_are_rebuilt_for_an_older_memory(tmp_path):
+    path = str(tmp_path / "tm.db")
+    memory = TranslationMemory(path)
+    memory.put("a line written before the counts", "tgt", "en", "zh", "")
+    memory.conn.execute("DROP TABLE gram_counts")
+    memory.conn.commit()
+    memory.conn.close()
+    reopened = TranslationMemory(path)
+    assert reopened.fuzzy("a line written before the count", "en", "zh")[0][2] == "tgt"
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT SUM(n) FROM gram_counts").fetchone()[0] == conn.execute("SELECT COUNT(*) FROM grams").fetchone()[0]
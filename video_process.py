@@ -10,6 +10,9 @@ from core import (
     _8_1_audio_task,_8_2_dub_chunks,
     _9_refer_audio,_10_gen_audio,
     _11_merge_audio,_12_dub_to_vid)
+from core.utils.models_batch import PathManager, _GPT_LOG_FOLDER, _LLM_REPORT
+from core.utils.retry_policy import RETRY
+from core.utils.ask_gpt import write_llm_report
 from rich.console import Console
 from rich.panel import Panel
 import threading
@@ -35,6 +38,8 @@ class VideoProcessor:
             console = get_console()
             video_name = Path(video_file).stem
             console.print(f"[cyan]开始处理视频: {video_name}[/cyan]")
+            # 每个视频重新计算重试预算
+            RETRY.reset_video(_GPT_LOG_FOLDER(PathManager(video_name)))
 
             # 1. 语音识别
             console.print(Panel("[bold green]🎤 执行语音识别...[/bold green]"))
@@ -92,6 +97,10 @@ class VideoProcessor:
             console = get_console()
             console.print(f"[red]❌ 处理视频 {video_file} 时出错: {str(e)}[/red]")
             return False
+        finally:
+            # 记录本视频的 LLM 调用统计（tokens、耗时、费用、缓存命中率）
+            path_manager = PathManager(Path(video_file).stem)
+            write_llm_report(_LLM_REPORT(path_manager), _GPT_LOG_FOLDER(path_manager))
 
     def process_videos(self, video_files):
         """并行处理多个视频文件"""
@@ -117,6 +126,9 @@ class VideoProcessor:
                 except Exception as e:
                     console.print(f"[red]× 处理出错 {video_file}: {str(e)}[/red]")
 
+        # 端点、限流和缓存统计由所有视频共享，只写入整体报告
+        write_llm_report(os.path.join('output', 'llm_report.json'))
+
 
 def main():
     # 示例使用